@@ -0,0 +1,204 @@
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from pyper.metrics import get_metrics
+
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def build_response_format(response_format) -> Dict[str, Any]:
+    """Convert a pydantic model into the `response_format` body of a raw request."""
+    from openai.lib._pydantic import to_strict_json_schema
+
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": response_format.__name__,
+            "schema": to_strict_json_schema(response_format),
+            "strict": True,
+        },
+    }
+
+
+class BatchExecutor:
+    """Runs chat completion requests end to end through the Batch API.
+
+    Requests are written as JSONL with one `custom_id` per request, split into
+    files that respect the per-file request and size limits, submitted, polled
+    with exponential backoff and read back from the output files. Requests that
+    fail are collected into a retry set and resubmitted, and results are
+    returned in the order of the original requests.
+
+    `client` only needs `files.create`, `files.with_streaming_response.content`,
+    `batches.create` and `batches.retrieve`, so a local stand-in for those
+    endpoints can be passed instead of `OpenAI()`.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        model: str = "gpt-4o",
+        max_tokens: int = 15000,
+        max_requests_per_file: int = 50000,
+        max_file_bytes: int = 190 * 1024 * 1024,
+        poll_interval: float = 10.0,
+        max_poll_interval: float = 300.0,
+        max_retries: int = 2,
+        data_dir: str = "./batch",
+        completion_window: str = "24h",
+    ):
+        if client is None:
+            from openai import OpenAI
+
+            client = OpenAI()
+        self.client = client
+        self.model = model
+        self.max_tokens = max_tokens
+        self.max_requests_per_file = max_requests_per_file
+        self.max_file_bytes = max_file_bytes
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.max_retries = max_retries
+        self.data_dir = data_dir
+        self.completion_window = completion_window
+
+    def build_request(
+        self,
+        custom_id: str,
+        messages: List[Dict],
+        response_format: Dict[str, Any],
+        **kwargs,
+    ) -> str:
+        body = {
+            "model": self.model,
+            "messages": messages,
+            "response_format": response_format,
+            "max_tokens": self.max_tokens,
+            **kwargs,
+        }
+        return json.dumps(
+            {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": body,
+            }
+        )
+
+    def _chunks(self, lines: List[str]) -> Iterator[List[str]]:
+        """Split request lines into files within the request count and size limits."""
+        chunk, size = [], 0
+        for line in lines:
+            line_size = len(line.encode()) + 1
+            if chunk and (
+                len(chunk) >= self.max_requests_per_file
+                or size + line_size > self.max_file_bytes
+            ):
+                yield chunk
+                chunk, size = [], 0
+            chunk.append(line)
+            size += line_size
+        if chunk:
+            yield chunk
+
+    def _submit(self, lines: List[str]) -> str:
+        os.makedirs(self.data_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        filename = f"{self.data_dir}/batch_tasks_{timestamp}.jsonl"
+        with open(filename, "w") as f:
+            for line in lines:
+                f.write(line + "\n")
+
+        with open(filename, "rb") as f:
+            batch_file = self.client.files.create(file=f, purpose="batch")
+
+        batch_job = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=self.completion_window,
+        )
+        print(f"submitted batch {batch_job.id} with {len(lines)} requests")
+        return batch_job.id
+
+    def _wait(self, batch_id: str):
+        """Poll a batch job with exponential backoff until it reaches a final state."""
+        interval = self.poll_interval
+        while True:
+            batch_job = self.client.batches.retrieve(batch_id)
+            if batch_job.status in TERMINAL_STATUSES:
+                print(f"batch {batch_id} finished with status {batch_job.status}")
+                return batch_job
+            time.sleep(interval)
+            interval = min(self.max_poll_interval, interval * 2)
+
+    def _iter_file(self, file_id: Optional[str]) -> Iterator[Dict]:
+        if not file_id:
+            return
+        with self.client.files.with_streaming_response.content(file_id) as response:
+            for line in response.iter_lines():
+                if line.strip():
+                    yield json.loads(line)
+
+    def _read_results(self, batch_job, stage: str = "default") -> Dict[str, Any]:
+        """Parse the output file of a finished batch into `custom_id -> content`."""
+        results = {}
+        metrics = get_metrics()
+        for row in self._iter_file(batch_job.output_file_id):
+            response = row.get("response") or {}
+            if response.get("status_code") != 200:
+                continue
+            metrics.record_usage(stage, (response.get("body") or {}).get("usage"))
+            try:
+                content = response["body"]["choices"][0]["message"]["content"]
+                results[row["custom_id"]] = json.loads(content)
+            except (KeyError, IndexError, TypeError, json.JSONDecodeError) as e:
+                print(f"failed to parse batch result {row.get('custom_id')}: {e}")
+        return results
+
+    def run(
+        self,
+        messages_list: List[List[Dict]],
+        response_format,
+        stage: str = "default",
+        **kwargs,
+    ) -> List[Optional[Dict]]:
+        """Run a list of requests through the Batch API.
+
+        Args:
+            messages_list: Messages of each request
+            response_format: Pydantic model describing the structured output
+            stage: Pipeline stage the token usage is recorded under
+
+        Returns:
+            Parsed responses in the order of `messages_list`. Requests that
+            still failed after all retries are returned as None
+        """
+        schema = build_response_format(response_format)
+        results: List[Optional[Dict]] = [None] * len(messages_list)
+        pending = list(range(len(messages_list)))
+
+        for attempt in range(self.max_retries + 1):
+            if not pending:
+                break
+            if attempt:
+                print(f"retrying {len(pending)} failed batch requests...")
+
+            lines = [
+                self.build_request(f"request-{i}", messages_list[i], schema, **kwargs)
+                for i in pending
+            ]
+            # submit every chunk before waiting so they are processed in parallel
+            batch_ids = [self._submit(chunk) for chunk in self._chunks(lines)]
+            for batch_id in batch_ids:
+                batch_job = self._wait(batch_id)
+                for custom_id, content in self._read_results(batch_job, stage).items():
+                    results[int(custom_id.split("-")[1])] = content
+
+            pending = [i for i in pending if results[i] is None]
+
+        if pending:
+            print(f"{len(pending)} batch requests failed after retries")
+        return results
@@ -0,0 +1,121 @@
+"""Check the CLI startup against an import-time budget.
+
+Run from the `pyper` directory like `run.py`:
+
+    python -m benchmark.import_time --budget-ms 150
+
+Runs `run.py --help` under `python -X importtime` a few times, sums the
+cumulative import time of everything `run.py` imports and exits with status
+1 when the median exceeds the budget or a heavy dependency is imported
+before a command needs it.
+"""
+
+import argparse
+import os
+import shlex
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+PYPER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# dependencies only the code path of a command may import
+HEAVY_MODULES = [
+    "chromadb",
+    "httpx",
+    "numpy",
+    "onnxruntime",
+    "openai",
+    "pydantic",
+    "tqdm",
+]
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """Parse `-X importtime` output into `(module, depth, cumulative_us)` rows.
+
+    Rows of the interpreter startup, everything up to and including `site`,
+    are dropped.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        module = name.strip()
+        if depth == 0 and module == "site":
+            rows = []
+            continue
+        rows.append((module, depth, int(cumulative)))
+    return rows
+
+
+def measure(command: List[str]) -> List[Tuple[str, int, int]]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(PYPER_DIR), env.get("PYTHONPATH", "")]
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *command],
+        cwd=PYPER_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} failed:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pyper CLI import-time budget")
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=150.0,
+        help="Maximum median import time of the command. Default: 150",
+    )
+    parser.add_argument(
+        "--runs", type=int, default=5, help="Number of measured runs. Default: 5"
+    )
+    parser.add_argument(
+        "--command",
+        default="run.py --help",
+        help="Script and arguments to measure. Default: 'run.py --help'",
+    )
+    args = parser.parse_args()
+    command = shlex.split(args.command)
+
+    totals = []
+    slowest: Dict[str, int] = {}
+    imported = set()
+    for _ in range(args.runs):
+        rows = measure(command)
+        totals.append(sum(us for _, depth, us in rows if depth == 0) / 1000)
+        for module, depth, us in rows:
+            imported.add(module.split(".")[0])
+            if depth == 0:
+                slowest[module] = max(slowest.get(module, 0), us)
+
+    total = statistics.median(totals)
+    print(f"median import time of {args.command}: {total:.1f} ms")
+    for module, us in sorted(slowest.items(), key=lambda x: -x[1])[:10]:
+        print(f"  {us / 1000:8.1f} ms  {module}")
+
+    failed = False
+    heavy = sorted(set(HEAVY_MODULES) & imported)
+    if heavy:
+        print(f"heavy dependencies imported at startup: {', '.join(heavy)}")
+        failed = True
+    if total > args.budget_ms:
+        print(f"over the budget of {args.budget_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
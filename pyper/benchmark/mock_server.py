@@ -0,0 +1,304 @@
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+# prompts ask for "exactly N" items, everything else gets this many
+DEFAULT_ARRAY_SIZE = 3
+# the API only caches prompts of at least this many tokens, in 128 token steps
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+CHARS_PER_TOKEN = 4
+
+
+class MockLLMServer:
+    """Local stand-in for the OpenAI chat completions, files and batches API.
+
+    Responses are random structured outputs generated from the JSON schema of
+    the request, so every response format of the pipeline is served without a
+    model. Latency follows a log-normal distribution, a share of requests can be
+    answered with 429 and a share of generated strings repeats earlier ones so
+    the dedup stages have work to do. Batch jobs complete as soon as they are
+    created.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 200.0,
+        latency_sigma: float = 0.5,
+        rate_limit_prob: float = 0.0,
+        duplicate_prob: float = 0.05,
+        vocabulary_size: int = 20000,
+        seed: int = 0,
+    ):
+        """
+        Args:
+            host: Interface to bind
+            port: Port to bind, a free one is picked when 0
+            latency_ms: Median latency of a chat completion
+            latency_sigma: Sigma of the log-normal latency distribution
+            rate_limit_prob: Share of chat completions answered with 429
+            duplicate_prob: Share of generated strings copied from earlier responses
+            vocabulary_size: Number of random words strings are built from
+            seed: Seed of the generated content
+        """
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.rate_limit_prob = rate_limit_prob
+        self.duplicate_prob = duplicate_prob
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._words = [
+            "".join(self._rng.choices("abcdefghijklmnopqrstuvwxyz", k=7))
+            for _ in range(vocabulary_size)
+        ]
+        self._history: List[str] = []
+        self._seen_prefixes = set()
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict] = {}
+        self.stats = {"requests": 0, "rate_limited": 0, "batch_requests": 0}
+
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="mock-llm", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _text(self) -> str:
+        with self._lock:
+            if self._history and self._rng.random() < self.duplicate_prob:
+                return self._rng.choice(self._history)
+            text = " ".join(self._rng.choices(self._words, k=10))
+            text = f"{text} {next(self._counter)}"
+            self._history.append(text)
+            return text
+
+    def _fake(self, schema: Dict, defs: Dict, size: int) -> Any:
+        if "$ref" in schema:
+            return self._fake(defs[schema["$ref"].split("/")[-1]], defs, size)
+        kind = schema.get("type")
+        if kind == "object":
+            return {
+                key: self._fake(value, defs, size)
+                for key, value in schema["properties"].items()
+            }
+        if kind == "array":
+            return [self._fake(schema["items"], defs, size) for _ in range(size)]
+        if kind == "integer":
+            return self._rng.randint(1, 5)
+        return self._text()
+
+    def _usage(self, messages: List[Dict], content: str) -> Dict:
+        prompt = json.dumps(messages)
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN
+        # prefix caching: the longest run of leading blocks seen in an earlier
+        # prompt is served from the cache
+        block = CACHE_BLOCK_TOKENS * CHARS_PER_TOKEN
+        digest = hashlib.sha1()
+        cached = 0
+        with self._lock:
+            for start in range(0, len(prompt) - block + 1, block):
+                digest.update(prompt[start : start + block].encode())
+                key = digest.copy().digest()
+                if key in self._seen_prefixes and cached == start // CHARS_PER_TOKEN:
+                    cached += CACHE_BLOCK_TOKENS
+                self._seen_prefixes.add(key)
+        if prompt_tokens < CACHE_MIN_TOKENS:
+            cached = 0
+        completion_tokens = len(content) // CHARS_PER_TOKEN
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached},
+        }
+
+    def complete(self, body: Dict) -> Dict:
+        """Build a chat completion for a request body."""
+        messages = body.get("messages", [])
+        text = " ".join(str(m.get("content", "")) for m in messages)
+        match = re.search(r"exactly (\d+)", text)
+        size = int(match.group(1)) if match else DEFAULT_ARRAY_SIZE
+
+        schema = body["response_format"]["json_schema"]["schema"]
+        content = json.dumps(self._fake(schema, schema.get("$defs", {}), size))
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }
+            ],
+            "usage": self._usage(messages, content),
+        }
+
+    def _latency(self) -> float:
+        with self._lock:
+            return self._rng.lognormvariate(0, self.latency_sigma) * self.latency_ms
+
+    def _rate_limited(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.rate_limit_prob
+
+    def _create_batch(self, body: Dict) -> Dict:
+        lines = self.files[body["input_file_id"]].decode().splitlines()
+        output = []
+        for line in lines:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            output.append(
+                json.dumps(
+                    {
+                        "id": f"batch_req_{uuid.uuid4().hex}",
+                        "custom_id": request["custom_id"],
+                        "response": {
+                            "status_code": 200,
+                            "body": self.complete(request["body"]),
+                        },
+                    }
+                )
+            )
+        self._count("batch_requests", len(output))
+        output_id = f"file-{uuid.uuid4().hex}"
+        self.files[output_id] = ("\n".join(output) + "\n").encode()
+
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex}",
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "completion_window": body["completion_window"],
+            "created_at": int(time.time()),
+            "input_file_id": body["input_file_id"],
+            "output_file_id": output_id,
+            "error_file_id": None,
+            "status": "completed",
+            "request_counts": {
+                "total": len(output),
+                "completed": len(output),
+                "failed": 0,
+            },
+        }
+        self.batches[batch["id"]] = batch
+        return batch
+
+    def _upload(self, content_type: str, body: bytes) -> Dict:
+        message = BytesParser(policy=policy.default).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        data = b""
+        for part in message.iter_parts():
+            if part.get_param("name", header="content-disposition") == "file":
+                data = part.get_content()
+                data = data if isinstance(data, bytes) else data.encode()
+        file_id = f"file-{uuid.uuid4().hex}"
+        self.files[file_id] = data
+        return {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(data),
+            "created_at": int(time.time()),
+            "filename": "batch.jsonl",
+            "purpose": "batch",
+            "status": "processed",
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, payload, headers: Dict = None):
+                data = payload if isinstance(payload, bytes) else json.dumps(payload)
+                data = data if isinstance(data, bytes) else data.encode()
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("content-length", 0)))
+
+            def do_POST(self):
+                raw = self._body()
+                if self.path.endswith("/chat/completions"):
+                    server._count("requests")
+                    if server._rate_limited():
+                        server._count("rate_limited")
+                        self._send(
+                            429,
+                            {"error": {"message": "rate limited", "type": "requests"}},
+                            {"retry-after-ms": "200"},
+                        )
+                        return
+                    time.sleep(server._latency() / 1000)
+                    self._send(200, server.complete(json.loads(raw)))
+                elif self.path.endswith("/files"):
+                    self._send(200, server._upload(self.headers["content-type"], raw))
+                elif self.path.endswith("/batches"):
+                    self._send(200, server._create_batch(json.loads(raw)))
+                else:
+                    self._send(404, {"error": {"message": "not found"}})
+
+            def do_GET(self):
+                match = re.search(r"/files/([^/]+)/content$", self.path)
+                if match and match.group(1) in server.files:
+                    self._send(200, server.files[match.group(1)])
+                    return
+                match = re.search(r"/batches/([^/]+)$", self.path)
+                if match and match.group(1) in server.batches:
+                    self._send(200, server.batches[match.group(1)])
+                    return
+                self._send(404, {"error": {"message": "not found"}})
+
+        return Handler
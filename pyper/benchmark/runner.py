@@ -0,0 +1,302 @@
+"""End-to-end throughput benchmark against the local mock LLM server.
+
+Run from the `pyper` directory like `run.py`:
+
+    python -m benchmark.runner --modes general knowledge fission --sizes 50 200
+
+Every scenario runs `Pipeline.run` in its own process so peak RSS and CPU
+time are not shared between scenarios. Results are written to
+`--output-dir` as one JSON file per run, `--compare` prints the change
+against an earlier file.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmark.mock_server import MockLLMServer
+
+PYPER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KNOWLEDGE_PATH = os.path.join(PYPER_DIR, "source", "example_knowledge.txt")
+RESULT_PREFIX = "BENCHMARK_RESULT "
+
+
+class HashingEmbedding:
+    """Deterministic bag-of-words embedding so benchmarks need no model download."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                h = int.from_bytes(hashlib.md5(word.encode()).digest()[:4], "little")
+                out[row, h % self.dim] += 1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+
+def _write_seed_file(path: str, num_seeds: int = 50):
+    rng = random.Random(0)
+    words = [
+        "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=6)) for _ in range(2000)
+    ]
+    with open(path, "w") as f:
+        for i in range(num_seeds):
+            f.write(
+                json.dumps(
+                    {
+                        "instruction": " ".join(rng.choices(words, k=12)) + f" {i}",
+                        "input": " ".join(rng.choices(words, k=6)),
+                        "output": " ".join(rng.choices(words, k=20)),
+                    }
+                )
+                + "\n"
+            )
+
+
+def run_scenario(mode: str, size: int, execution: str, concurrency: int) -> Dict:
+    """Run one pipeline scenario in this process and return its measurements."""
+    from fission.generate import FissionGenerator
+    from gen.src.general_generator import GeneralGenerator
+    from gen.src.knowledge_generator import KnowledgeGenerator
+    from pipeline import FissionConfig, GeneralConfig, KnowledgeConfig, Pipeline
+    from pyper.metrics import configure_metrics
+
+    # generators embed with the hashing function instead of the MiniLM model
+    def offline(cls):
+        class Offline(cls):
+            def __init__(self):
+                super().__init__()
+                self.embedding_fn = HashingEmbedding()
+
+        return Offline
+
+    metrics = configure_metrics()
+    workdir = tempfile.mkdtemp(prefix="pyper-bench-")
+    output_path = os.path.join(workdir, f"{mode}.jsonl")
+    # batch files and checkpoints go to the scratch directory, not the repo
+    os.chdir(workdir)
+
+    if mode == "general":
+        pipeline = Pipeline(gen=offline(GeneralGenerator))
+        kwargs = {
+            "seed_output_path": output_path,
+            "gen_config": GeneralConfig(
+                discipline="benchmark",
+                num_tasks=size,
+                num_questions=5,
+                execution=execution,
+            ),
+        }
+    elif mode == "knowledge":
+        pipeline = Pipeline(gen=offline(KnowledgeGenerator))
+        kwargs = {
+            "seed_output_path": output_path,
+            "gen_config": KnowledgeConfig(
+                num_tasks=size,
+                knowledge_path=KNOWLEDGE_PATH,
+                num_sessions=3,
+                num_questions=5,
+                execution=execution,
+            ),
+        }
+    elif mode == "fission":
+        seed_path = os.path.join(workdir, "seed.jsonl")
+        _write_seed_file(seed_path)
+        pipeline = Pipeline(fission=offline(FissionGenerator))
+        kwargs = {
+            "result_output_path": output_path,
+            "fission_config": FissionConfig(
+                num_tasks=size,
+                seed_path=seed_path,
+                execution=execution,
+                seed_embedding_cache=False,
+                concurrency=concurrency,
+            ),
+        }
+    else:
+        raise ValueError(f"Unsupported benchmark mode: {mode}")
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    pipeline.run(**kwargs)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    with open(output_path) as f:
+        tasks = sum(1 for line in f if line.strip())
+    stages = metrics.snapshot()["stages"]
+    requests = sum(stage["requests"] for stage in stages.values())
+    return {
+        "mode": mode,
+        "size": size,
+        "execution": execution,
+        "tasks": tasks,
+        "requests": requests,
+        "wall_seconds": round(wall, 3),
+        "cpu_seconds": round(cpu, 3),
+        "tasks_per_second": round(tasks / wall, 3),
+        "requests_per_second": round(requests / wall, 3),
+        # ru_maxrss is reported in kilobytes on linux
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+        "stages": stages,
+    }
+
+
+def _run_child(args, mode: str, size: int, base_url: str) -> Optional[Dict]:
+    env = dict(os.environ)
+    env["OPENAI_BASE_URL"] = base_url
+    env["OPENAI_API_KEY"] = "mock"
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(PYPER_DIR), env.get("PYTHONPATH", "")]
+    )
+    command = [
+        sys.executable,
+        "-m",
+        "benchmark.runner",
+        "--scenario",
+        f"{mode}:{size}",
+        "--execution",
+        args.execution,
+        "--concurrency",
+        str(args.concurrency),
+    ]
+    proc = subprocess.run(
+        command, cwd=PYPER_DIR, env=env, capture_output=True, text=True
+    )
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX) :])
+    print(f"scenario {mode}:{size} failed:\n{proc.stderr[-2000:]}")
+    return None
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=PYPER_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_table(results: List[Dict], baseline: Optional[Dict] = None):
+    previous = {}
+    if baseline:
+        previous = {(r["mode"], r["size"]): r for r in baseline["results"]}
+
+    print(
+        f"{'scenario':<18}{'tasks/s':>10}{'req/s':>10}{'wall s':>10}"
+        f"{'cpu s':>10}{'rss MB':>10}"
+    )
+    for r in results:
+        line = (
+            f"{r['mode'] + ':' + str(r['size']):<18}{r['tasks_per_second']:>10}"
+            f"{r['requests_per_second']:>10}{r['wall_seconds']:>10}"
+            f"{r['cpu_seconds']:>10}{r['peak_rss_mb']:>10}"
+        )
+        old = previous.get((r["mode"], r["size"]))
+        if old and old["tasks_per_second"]:
+            change = r["tasks_per_second"] / old["tasks_per_second"] - 1
+            line += f"   {change:+.1%} tasks/s vs baseline"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pyper throughput benchmark")
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        choices=["general", "knowledge", "fission"],
+        default=["general", "knowledge", "fission"],
+    )
+    parser.add_argument("--sizes", nargs="+", type=int, default=[50, 200])
+    parser.add_argument("--execution", choices=["online", "batch"], default="online")
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="Fission rounds in flight"
+    )
+    parser.add_argument(
+        "--latency-ms", type=float, default=200.0, help="Median mock latency"
+    )
+    parser.add_argument(
+        "--latency-sigma", type=float, default=0.5, help="Log-normal latency sigma"
+    )
+    parser.add_argument(
+        "--rate-limit-prob", type=float, default=0.0, help="Share of 429 responses"
+    )
+    parser.add_argument(
+        "--duplicate-prob",
+        type=float,
+        default=0.05,
+        help="Share of generated strings repeating earlier ones",
+    )
+    parser.add_argument("--output-dir", default="./data/benchmarks")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        mode, size = args.scenario.split(":")
+        result = run_scenario(mode, int(size), args.execution, args.concurrency)
+        print(RESULT_PREFIX + json.dumps(result))
+        return
+
+    server = MockLLMServer(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        rate_limit_prob=args.rate_limit_prob,
+        duplicate_prob=args.duplicate_prob,
+    )
+    results = []
+    with server:
+        for mode in args.modes:
+            for size in args.sizes:
+                print(f"running {mode}:{size}...")
+                result = _run_child(args, mode, size, server.base_url)
+                if result is not None:
+                    results.append(result)
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "config": {k: v for k, v in vars(args).items() if k != "scenario"},
+        "server": server.stats,
+        "results": results,
+    }
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(
+        args.output_dir, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    _print_table(results, baseline)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+
+class ResponseCache:
+    """On-disk, content-addressed cache for LLM responses backed by SQLite.
+
+    Entries are keyed by a hash of the model, messages, response schema and
+    sampling params. Identical requests issued several times in one run (e.g.
+    question generation for the same session) are told apart by their
+    occurrence count, so a re-run replays the same sequence of responses while
+    a single run still gets fresh samples for every repeat.
+
+    The cache is bounded by `max_bytes` with least-recently-used eviction and
+    entries older than `ttl` seconds are treated as misses. Access times of hits
+    are buffered and written in batches, so a hit does not commit.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = 1024 * 1024 * 1024,
+        ttl: Optional[float] = 7 * 24 * 3600,
+        touch_batch: int = 256,
+    ):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "responses.sqlite")
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.touch_batch = touch_batch
+
+        self.hits = 0
+        self.misses = 0
+        self._occurrences = Counter()
+        self._lock = threading.Lock()
+        # access times of hits not written yet
+        self._touched: Dict[str, float] = {}
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # in WAL mode this only syncs at checkpoints, a crash can lose the last
+        # commits but never corrupts the cache
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self._conn.commit()
+        self._size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    def make_key(
+        self,
+        model: str,
+        messages: List[Dict],
+        schema: Dict,
+        params: Dict[str, Any],
+    ) -> str:
+        """Build the cache key for one request, counting repeats within the run."""
+        payload = json.dumps(
+            {
+                "model": model,
+                "messages": messages,
+                "schema": schema,
+                "params": params,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        digest = hashlib.sha256(payload.encode()).hexdigest()
+        with self._lock:
+            occurrence = self._occurrences[digest]
+            self._occurrences[digest] += 1
+        return f"{digest}:{occurrence}"
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, size, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl is not None and now - row[2] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self._size -= row[1]
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._touched[key] = now
+            if len(self._touched) >= self.touch_batch:
+                self._flush_touched()
+                self._conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def _flush_touched(self):
+        self._conn.executemany(
+            "UPDATE responses SET accessed = ? WHERE key = ?",
+            [(accessed, key) for key, accessed in self._touched.items()],
+        )
+        self._touched = {}
+
+    def put(self, key: str, value: Any):
+        data = json.dumps(value)
+        size = len(data.encode())
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, data, size, now, now),
+            )
+            self._size += size - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                # eviction goes by access time, it must see the buffered hits
+                self._flush_touched()
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits in `max_bytes`."""
+        while self._size > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed LIMIT 100"
+            ).fetchall()
+            if not rows:
+                self._size = 0
+                return
+            for key, size in rows:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._size -= size
+                if self._size <= self.max_bytes:
+                    break
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "bytes": self._size}
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
@@ -0,0 +1,50 @@
+import os
+import pickle
+import time
+from typing import Any, Dict, Optional
+
+
+class Checkpoint:
+    """Periodically persists the state of a generation loop so it can be resumed.
+
+    State is pickled to a temporary file, fsynced and atomically renamed over
+    `path`, so a crash while saving never corrupts the previous checkpoint.
+    """
+
+    def __init__(self, path: str, interval: float = 60.0):
+        """
+        Args:
+            path: File the checkpoint is stored in
+            interval: Minimum seconds between two saves
+        """
+        self.path = path
+        self.interval = interval
+        self.state: Optional[Dict[str, Any]] = None
+        self._last_save = time.monotonic()
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Load the saved state into `self.state`, None if there is no checkpoint."""
+        if not os.path.exists(self.path):
+            print(f"no checkpoint found at {self.path}, starting from scratch")
+            return None
+        with open(self.path, "rb") as f:
+            self.state = pickle.load(f)
+        return self.state
+
+    def due(self) -> bool:
+        return time.monotonic() - self._last_save >= self.interval
+
+    def save(self, state: Dict[str, Any]):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._last_save = time.monotonic()
+
+    def clear(self):
+        """Remove the checkpoint once the run has completed."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,49 @@
+from typing import Iterator, List
+
+# rough estimate used wherever prompts are sized before sending them
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
+
+
+def iter_chunks(path: str, max_tokens: int = 8000) -> Iterator[str]:
+    """Stream a text file as chunks of at most `max_tokens` estimated tokens.
+
+    Chunks end at a paragraph break where possible, otherwise at a line break.
+    Lines longer than the limit are split at the limit, so only one chunk is
+    held in memory however large the file or its lines are.
+
+    Args:
+        path: Text file to read
+        max_tokens: Upper bound of the estimated tokens of a chunk
+
+    Yields:
+        Chunks in file order, chunks holding only whitespace are skipped
+    """
+    max_chars = max(1, max_tokens * CHARS_PER_TOKEN)
+    lines: List[str] = []
+    size = 0
+    # number of leading lines that end with a paragraph break
+    boundary = 0
+
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in iter(lambda: f.readline(max_chars), ""):
+            while lines and size + len(line) > max_chars:
+                cut = boundary or len(lines)
+                text = "".join(lines[:cut])
+                if text.strip():
+                    yield text
+                lines = lines[cut:]
+                size = sum(len(kept) for kept in lines)
+                boundary = 0
+
+            lines.append(line)
+            size += len(line)
+            if not line.strip():
+                boundary = len(lines)
+
+    text = "".join(lines)
+    if text.strip():
+        yield text
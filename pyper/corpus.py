@@ -0,0 +1,142 @@
+import glob
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+MANIFEST_VERSION = 1
+
+
+def resolve_knowledge_files(path: str) -> List[str]:
+    """Expand a knowledge path into the files it covers.
+
+    Args:
+        path: A file, a directory searched recursively or a glob pattern.
+            Hidden files and directories are skipped
+
+    Returns:
+        Sorted file paths
+    """
+    if os.path.isdir(path):
+        files = []
+        for root, dirs, names in os.walk(path):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            files.extend(
+                os.path.join(root, name) for name in names if not name.startswith(".")
+            )
+    elif glob.has_magic(path):
+        files = [f for f in glob.glob(path, recursive=True) if os.path.isfile(f)]
+    else:
+        files = [path]
+
+    if not files:
+        raise FileNotFoundError(f"No knowledge files found at {path}")
+    return sorted(files)
+
+
+def chunk_hash(text: str, salt: str = "") -> str:
+    return hashlib.sha1(f"{salt}\0{text}".encode()).hexdigest()
+
+
+class KnowledgeManifest:
+    """Record of the knowledge corpus already turned into syllabi and questions.
+
+    Every chunk of the corpus is stored by content hash together with the
+    partial syllabus generated from it, so a later run only requests syllabi
+    for new or changed chunks. Files whose size and modification time did not
+    change are not read again. Questions accepted in earlier runs are kept so
+    new questions are deduplicated against them. The manifest is written as
+    JSON with an atomic rename.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: JSON file the manifest is stored in, loaded when it exists
+        """
+        self.path = path
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.chunks: Dict[str, Dict] = {}
+        self.questions: List[Dict] = []
+        # entries recorded in this run, checkpointed until the run saves them
+        self._pending_files = set()
+        self._pending_chunks = set()
+
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.files = data["files"]
+                self.chunks = data["chunks"]
+                self.questions = data["questions"]
+            else:
+                print(f"ignoring manifest {path} of an older version")
+
+    def _stat(self, path: str) -> Dict[str, Any]:
+        stat = os.stat(path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def unchanged_chunks(self, path: str) -> Optional[List[str]]:
+        """Chunk hashes of `path` if it did not change since it was recorded."""
+        entry = self.files.get(os.path.abspath(path))
+        if entry is None or entry["stat"] != self._stat(path):
+            return None
+        if not all(h in self.chunks for h in entry["chunks"]):
+            return None
+        return entry["chunks"]
+
+    def covers(self, paths: List[str]) -> bool:
+        """Whether every file in `paths` was processed and did not change since."""
+        return all(self.unchanged_chunks(p) is not None for p in paths)
+
+    def record_file(self, path: str, hashes: List[str]):
+        path = os.path.abspath(path)
+        self.files[path] = {"stat": self._stat(path), "chunks": hashes}
+        self._pending_files.add(path)
+
+    def record_chunk(self, chunk: str, syllabus: Dict):
+        self.chunks[chunk] = {"syllabus": syllabus}
+        self._pending_chunks.add(chunk)
+
+    def pending(self) -> Dict[str, Dict]:
+        """Files and chunks recorded in this run, for checkpoints."""
+        return {
+            "files": {p: self.files[p] for p in self._pending_files if p in self.files},
+            "chunks": {
+                h: self.chunks[h] for h in self._pending_chunks if h in self.chunks
+            },
+        }
+
+    def restore_pending(self, pending: Dict[str, Dict]):
+        """Record the files and chunks of an interrupted run again."""
+        self.files.update(pending["files"])
+        self.chunks.update(pending["chunks"])
+        self._pending_files.update(pending["files"])
+        self._pending_chunks.update(pending["chunks"])
+
+    def record_questions(self, questions: List[Dict]):
+        self.questions.extend(
+            {"question": q["question"], "input": q["input"]} for q in questions
+        )
+
+    def prune(self, paths: List[str]):
+        """Forget files no longer in the corpus and chunks no file refers to."""
+        current = {os.path.abspath(p) for p in paths}
+        self.files = {p: e for p, e in self.files.items() if p in current}
+        referenced = {h for e in self.files.values() for h in e["chunks"]}
+        self.chunks = {h: c for h, c in self.chunks.items() if h in referenced}
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "version": MANIFEST_VERSION,
+                    "files": self.files,
+                    "chunks": self.chunks,
+                    "questions": self.questions,
+                },
+                f,
+            )
+        os.replace(tmp_path, self.path)
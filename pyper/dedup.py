@@ -0,0 +1,352 @@
+import math
+import re
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# squared L2 distance under which two texts are considered duplicates
+DUPLICATE_DISTANCE = 0.7
+
+_chroma_client = None
+_chroma_lock = threading.Lock()
+
+
+def _get_chroma_client():
+    """Return the process-wide chroma client, its setup is not thread-safe."""
+    global _chroma_client
+    with _chroma_lock:
+        if _chroma_client is None:
+            import chromadb
+
+            _chroma_client = chromadb.Client()
+        return _chroma_client
+
+
+class DedupIndex(ABC):
+    """Nearest-neighbour index answering "how close is the closest accepted text".
+
+    Distances are squared L2 distances, the metric chroma uses by default.
+    """
+
+    @abstractmethod
+    def add(self, embeddings: np.ndarray, documents: List[str]):
+        """Add embeddings of accepted texts to the index"""
+        pass
+
+    @abstractmethod
+    def nearest(self, embeddings: np.ndarray) -> np.ndarray:
+        """Distance from each row to its nearest neighbour, inf if the index is empty"""
+        pass
+
+    @abstractmethod
+    def dump(self, start: int = 0) -> Dict[str, Any]:
+        """Export the entries added from position `start` on for checkpoints"""
+        pass
+
+    @abstractmethod
+    def load(self, dump: Dict[str, Any]):
+        """Add exported entries to the index without re-embedding anything"""
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+
+class NumpyIndex(DedupIndex):
+    """In-process index over a preallocated, growable matrix of normalized embeddings.
+
+    Top-1 search is a matrix-vector product over the stored rows. For unit
+    vectors the squared L2 distance is `2 - 2 * cosine`, so results match
+    chroma for the normalized embeddings of the default embedding model.
+    Rows can be stored as float16 or int8 to cut memory at millions of entries.
+    """
+
+    INT8_SCALE = 127.0
+
+    def __init__(
+        self,
+        dtype: str = "float32",
+        capacity: int = 1024,
+        chunk_size: int = 65536,
+    ):
+        """
+        Args:
+            dtype: Storage type of the rows, one of float32, float16 or int8
+            capacity: Number of rows preallocated before the first growth
+            chunk_size: Rows scored at once when searching a quantized matrix
+        """
+        if dtype not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unsupported index dtype: {dtype}")
+        self.dtype = dtype
+        self.capacity = capacity
+        self.chunk_size = chunk_size
+        self.size = 0
+        self.matrix: Optional[np.ndarray] = None
+
+    def _encode(self, embeddings: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        normalized = embeddings / np.maximum(norms, 1e-12)
+        if self.dtype == "int8":
+            return np.round(normalized * self.INT8_SCALE).astype(np.int8)
+        return normalized.astype(self.dtype)
+
+    def _grow(self, needed: int, dim: int):
+        if self.matrix is None:
+            capacity = max(self.capacity, needed)
+            self.matrix = np.zeros((capacity, dim), dtype=self.dtype)
+            return
+        if needed <= self.matrix.shape[0]:
+            return
+        capacity = max(needed, self.matrix.shape[0] * 2)
+        grown = np.zeros((capacity, dim), dtype=self.dtype)
+        grown[: self.size] = self.matrix[: self.size]
+        self.matrix = grown
+
+    def add(self, embeddings: np.ndarray, documents: List[str] = None):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if not len(embeddings):
+            return
+        self._grow(self.size + len(embeddings), embeddings.shape[1])
+        self.matrix[self.size : self.size + len(embeddings)] = self._encode(embeddings)
+        self.size += len(embeddings)
+
+    def nearest(self, embeddings: np.ndarray) -> np.ndarray:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if not self.size:
+            return np.full(len(embeddings), np.inf, dtype=np.float32)
+
+        queries = embeddings / np.maximum(
+            np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12
+        )
+        if self.dtype == "float32":
+            best = (self.matrix[: self.size] @ queries.T).max(axis=0)
+        else:
+            # quantized rows are scored in float32 chunks to avoid overflow
+            best = np.full(len(queries), -np.inf, dtype=np.float32)
+            for start in range(0, self.size, self.chunk_size):
+                chunk = self.matrix[start : min(self.size, start + self.chunk_size)]
+                sims = chunk.astype(np.float32) @ queries.T
+                best = np.maximum(best, sims.max(axis=0))
+            if self.dtype == "int8":
+                best /= self.INT8_SCALE
+        return 2 - 2 * best
+
+    def search(self, embeddings: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Find the `k` nearest rows of each query.
+
+        Returns:
+            `(rows, distances)` of shape `(len(embeddings), min(k, len(self)))`,
+            nearest first
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        k = min(k, self.size)
+        best_rows = np.zeros((len(embeddings), 0), dtype=np.int64)
+        best_sims = np.zeros((len(embeddings), 0), dtype=np.float32)
+        if not k:
+            return best_rows, best_sims
+
+        queries = embeddings / np.maximum(
+            np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12
+        )
+        # rows are scored in chunks, only the best k of each query are kept
+        for start in range(0, self.size, self.chunk_size):
+            chunk = self.matrix[start : min(self.size, start + self.chunk_size)]
+            sims = queries @ chunk.astype(np.float32, copy=False).T
+            rows = np.broadcast_to(np.arange(start, start + len(chunk)), sims.shape)
+            sims = np.concatenate([best_sims, sims], axis=1)
+            rows = np.concatenate([best_rows, rows], axis=1)
+            keep = min(k, sims.shape[1])
+            top = np.argpartition(-sims, keep - 1, axis=1)[:, :keep]
+            best_sims = np.take_along_axis(sims, top, axis=1)
+            best_rows = np.take_along_axis(rows, top, axis=1)
+
+        order = np.argsort(-best_sims, axis=1)
+        best_sims = np.take_along_axis(best_sims, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        if self.dtype == "int8":
+            best_sims /= self.INT8_SCALE
+        return best_rows, 2 - 2 * best_sims
+
+    def dump(self, start: int = 0) -> Dict[str, Any]:
+        matrix = (
+            self.matrix[start : self.size].copy() if self.matrix is not None else None
+        )
+        return {"dtype": self.dtype, "matrix": matrix}
+
+    def load(self, dump: Dict[str, Any]):
+        matrix = dump["matrix"]
+        if not self.size:
+            self.dtype = dump["dtype"]
+            self.matrix = matrix
+            self.size = len(matrix) if matrix is not None else 0
+            return
+        if matrix is None or not len(matrix):
+            return
+        if dump["dtype"] != self.dtype:
+            raise ValueError(
+                f"Cannot load {dump['dtype']} rows into a {self.dtype} index"
+            )
+        self._grow(self.size + len(matrix), matrix.shape[1])
+        self.matrix[self.size : self.size + len(matrix)] = matrix
+        self.size += len(matrix)
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class ChromaIndex(DedupIndex):
+    """Index backed by an ephemeral chroma collection."""
+
+    def __init__(self, name: str = "dedup"):
+        # collection names are unique per process, generators must not collide.
+        # chroma allows 63 characters from [a-zA-Z0-9._-]
+        prefix = re.sub(r"[^a-zA-Z0-9_-]", "_", name)[:30]
+        self.collection = _get_chroma_client().create_collection(
+            f"{prefix}_{uuid.uuid4().hex}", embedding_function=None
+        )
+        # ids in insertion order, chroma does not keep the order
+        self.ids: List[str] = []
+
+    def add(self, embeddings: np.ndarray, documents: List[str], batch_size=5000):
+        for i in range(0, len(documents), batch_size):
+            ids = [uuid.uuid4().hex for _ in documents[i : i + batch_size]]
+            self.collection.add(
+                ids=ids,
+                embeddings=embeddings[i : i + batch_size],
+                documents=documents[i : i + batch_size],
+            )
+            self.ids.extend(ids)
+
+    def nearest(self, embeddings: np.ndarray) -> np.ndarray:
+        if not self.collection.count():
+            return np.full(len(embeddings), np.inf, dtype=np.float32)
+        res = self.collection.query(query_embeddings=embeddings, n_results=1)
+        return np.array(
+            [d[0] if d else np.inf for d in res["distances"]], dtype=np.float32
+        )
+
+    def dump(self, start: int = 0) -> Dict[str, Any]:
+        if not start:
+            return self.collection.get(include=["embeddings", "documents"])
+        if start >= len(self.ids):
+            return {"embeddings": np.zeros((0, 0)), "documents": []}
+        return self.collection.get(
+            ids=self.ids[start:], include=["embeddings", "documents"]
+        )
+
+    def load(self, dump: Dict[str, Any]):
+        self.add(np.asarray(dump["embeddings"]), dump["documents"])
+
+    def __len__(self) -> int:
+        return self.collection.count()
+
+
+class AcceptanceRate:
+    """Exponential moving average of the share of candidates that survive dedup.
+
+    Generation loops use it to size requests to the remaining deficit instead
+    of always asking for a full batch.
+    """
+
+    def __init__(self, alpha: float = 0.3, initial: float = 1.0, floor: float = 0.05):
+        """
+        Args:
+            alpha: Weight of the latest observation
+            initial: Rate assumed before anything was deduplicated
+            floor: Lower bound of the rate used for sizing requests
+        """
+        self.alpha = alpha
+        self.rate = initial
+        self.floor = floor
+
+    def update(self, candidates: int, accepted: int):
+        if candidates:
+            observed = accepted / candidates
+            self.rate = self.alpha * observed + (1 - self.alpha) * self.rate
+
+    def expected(self, candidates: int) -> float:
+        """Number of survivors expected from `candidates` new candidates."""
+        return candidates * self.rate
+
+    def requested(self, needed: int) -> int:
+        """Number of candidates to request so that `needed` are expected to survive."""
+        return math.ceil(needed / max(self.rate, self.floor))
+
+
+def create_index(backend: str = "numpy", dtype: str = "float32", name: str = "dedup"):
+    """Create a dedup index for the given backend name.
+
+    Args:
+        backend: `numpy` for the in-process matrix index or `chroma`
+        dtype: Storage type of the numpy backend
+        name: Collection name prefix of the chroma backend
+    """
+    if backend == "numpy":
+        return NumpyIndex(dtype=dtype)
+    if backend == "chroma":
+        return ChromaIndex(name=name)
+    raise ValueError(f"Unsupported dedup backend: {backend}")
+
+
+def default_embedding_fn() -> Callable:
+    """Embedding function used for dedup, chroma's default MiniLM model."""
+    from chromadb.utils import embedding_functions
+
+    return embedding_functions.DefaultEmbeddingFunction()
+
+
+def pairwise_distances(embeddings: np.ndarray) -> np.ndarray:
+    """Squared L2 distances between all rows, the metric of the dedup index."""
+    sq = (embeddings * embeddings).sum(axis=1)
+    return sq[:, None] + sq[None, :] - 2 * embeddings @ embeddings.T
+
+
+def deduplicate_batch(
+    texts: List[str],
+    embedding_fn: Callable,
+    index: DedupIndex,
+    threshold: float = DUPLICATE_DISTANCE,
+    limit: Optional[int] = None,
+) -> List[int]:
+    """Deduplicate a whole batch of texts against the index and each other.
+
+    The batch is embedded in one pass and searched against the index in one
+    call. Near-duplicates inside the batch are resolved with a pairwise
+    distance matrix, keeping the first occurrence, and the survivors are added
+    to the index in one bulk insert.
+
+    Args:
+        texts: Candidate texts
+        embedding_fn: Function embedding a list of texts
+        index: Index holding the accepted texts
+        threshold: Distance at or below which a text counts as a duplicate
+        limit: Maximum number of texts to keep, the rest of the batch is
+            dropped without being added to the index
+
+    Returns:
+        Indices of the texts that were kept, in input order
+    """
+    if not texts:
+        return []
+
+    embeddings = np.asarray(embedding_fn(texts), dtype=np.float32)
+    is_new = index.nearest(embeddings) > threshold
+
+    distances = pairwise_distances(embeddings)
+    keep = []
+    for i in range(len(texts)):
+        if limit is not None and len(keep) >= limit:
+            break
+        if not is_new[i]:
+            continue
+        if keep and distances[i, keep].min() <= threshold:
+            continue
+        keep.append(i)
+
+    if keep:
+        index.add(embeddings[keep], [texts[i] for i in keep])
+    return keep
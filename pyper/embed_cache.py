@@ -0,0 +1,219 @@
+import bisect
+import glob
+import hashlib
+import os
+import tempfile
+import threading
+import uuid
+from typing import Callable, Dict, List
+
+import numpy as np
+
+_caches: Dict[str, "EmbeddingCache"] = {}
+_caches_lock = threading.Lock()
+
+
+def _text_hash(text: str) -> bytes:
+    return hashlib.sha1(text.encode()).digest()
+
+
+def save_npy(path: str, array: np.ndarray):
+    """Write `array` to `path` through a uniquely named temp file and a rename.
+
+    Jobs writing the same file concurrently never share a temp file, readers
+    see either the old or the new file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp.npy")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class EmbeddingCache:
+    """Content-addressed embedding store persisted as memory-mapped `.npy` files.
+
+    The cache is a set of append-only segments, each a matrix
+    `<prefix>.seg-<id>.npy` with the key of every embedded text, its sha1 by
+    default, in `<prefix>.seg-<id>.keys.npy`. Later runs map the segments into memory
+    without reading them and only embed texts whose hash is not stored yet.
+    New rows are kept in memory until `save` writes them as a new segment, so
+    a save costs the size of the new rows and jobs sharing a prefix never
+    write the same file. Segments are merged when a run starts with more than
+    `max_segments` of them.
+
+    The cache is callable like an embedding function.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        embedding_fn: Callable,
+        max_segments: int = 16,
+        key_fn: Callable[[str], bytes] = _text_hash,
+    ):
+        """
+        Args:
+            prefix: Path prefix of the cache files
+            embedding_fn: Function embedding a list of texts on a cache miss
+            max_segments: Number of segments above which they are merged on load
+            key_fn: Function returning the fixed-size binary key of a text
+        """
+        self.prefix = prefix
+        self.embedding_fn = embedding_fn
+        self.key_fn = key_fn
+        self.max_segments = max_segments
+
+        self._lock = threading.Lock()
+        self._segments: List[np.ndarray] = []
+        # row of the first entry of every segment
+        self._starts: List[int] = []
+        self._stored = 0
+        self._rows: Dict[bytes, int] = {}
+        self._new_keys: List[bytes] = []
+        self._new_rows: List[np.ndarray] = []
+
+        if len(self._segment_paths()) > max_segments:
+            self._compact()
+        self._load()
+
+    def _segment_paths(self) -> List[str]:
+        """Matrix paths of the complete segments, a segment's keys are written last."""
+        keys = sorted(glob.glob(f"{glob.escape(self.prefix)}.seg-*.keys.npy"))
+        paths = [k[: -len(".keys.npy")] + ".npy" for k in keys]
+        # single file layout of earlier versions
+        if os.path.exists(f"{self.prefix}.keys.npy"):
+            paths.insert(0, f"{self.prefix}.npy")
+        return paths
+
+    def _read_segment(self, path: str):
+        """`(matrix, keys)` of a segment, None if it vanished or is inconsistent."""
+        try:
+            matrix = np.load(path, mmap_mode="r")
+            keys = np.load(path[: -len(".npy")] + ".keys.npy")
+        except FileNotFoundError:
+            # merged away by another job
+            return None
+        if len(keys) != len(matrix):
+            print(f"ignoring inconsistent embedding cache segment {path}")
+            return None
+        return matrix, keys
+
+    def _load(self):
+        for path in self._segment_paths():
+            segment = self._read_segment(path)
+            if segment is None:
+                continue
+            matrix, keys = segment
+            self._add_segment(matrix, [key.tobytes() for key in keys])
+
+    def _add_segment(self, matrix: np.ndarray, keys: List[bytes]):
+        self._segments.append(matrix)
+        self._starts.append(self._stored)
+        for i, key in enumerate(keys):
+            self._rows.setdefault(key, self._stored + i)
+        self._stored += len(matrix)
+
+    def _compact(self):
+        """Merge all segments into one, skipped while another job merges them."""
+        try:
+            import fcntl
+        except ImportError:
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.prefix)), exist_ok=True)
+        with open(f"{self.prefix}.lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return
+            paths = self._segment_paths()
+            if len(paths) <= self.max_segments:
+                return
+
+            print(f"merging {len(paths)} embedding cache segments at {self.prefix}")
+            matrices, keys, seen = [], [], set()
+            for path in paths:
+                segment = self._read_segment(path)
+                if segment is None:
+                    continue
+                matrix, segment_keys = segment
+                fresh = [
+                    i for i, key in enumerate(segment_keys) if key.tobytes() not in seen
+                ]
+                seen.update(segment_keys[i].tobytes() for i in fresh)
+                matrices.append(matrix[fresh])
+                keys.append(segment_keys[fresh])
+            if matrices:
+                self._write_segment(np.concatenate(matrices), np.concatenate(keys))
+            for path in paths:
+                # keys first, a segment without keys is ignored by readers
+                for name in (path[: -len(".npy")] + ".keys.npy", path):
+                    if os.path.exists(name):
+                        os.unlink(name)
+
+    def _write_segment(self, matrix: np.ndarray, keys: np.ndarray) -> str:
+        path = f"{self.prefix}.seg-{uuid.uuid4().hex}.npy"
+        save_npy(path, matrix)
+        save_npy(path[: -len(".npy")] + ".keys.npy", keys)
+        return path
+
+    def _row(self, i: int) -> np.ndarray:
+        if i < self._stored:
+            segment = bisect.bisect_right(self._starts, i) - 1
+            return self._segments[segment][i - self._starts[segment]]
+        return self._new_rows[i - self._stored]
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        hashes = [self.key_fn(t) for t in texts]
+        with self._lock:
+            missing = {}
+            for h, t in zip(hashes, texts):
+                if h not in self._rows and h not in missing:
+                    missing[h] = t
+
+            if missing:
+                embeddings = np.asarray(
+                    self.embedding_fn(list(missing.values())), dtype=np.float32
+                )
+                for h, emb in zip(missing, embeddings):
+                    self._rows[h] = self._stored + len(self._new_rows)
+                    self._new_keys.append(h)
+                    self._new_rows.append(emb)
+
+            return np.stack([self._row(self._rows[h]) for h in hashes]).astype(
+                np.float32
+            )
+
+    def save(self):
+        """Write the embeddings added since the last save as a new segment."""
+        with self._lock:
+            if not self._new_rows:
+                return
+            keys = np.frombuffer(b"".join(self._new_keys), dtype=np.uint8)
+            keys = keys.reshape(len(self._new_keys), -1)
+            path = self._write_segment(np.stack(self._new_rows), keys)
+
+            # rows keep their numbers, the new ones now live in the segment
+            self._segments.append(np.load(path, mmap_mode="r"))
+            self._starts.append(self._stored)
+            self._stored += len(self._new_rows)
+            self._new_keys, self._new_rows = [], []
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+def get_embedding_cache(prefix: str, embedding_fn: Callable) -> EmbeddingCache:
+    """Return the process-wide cache for `prefix` so generators share one store."""
+    key = os.path.abspath(prefix)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = EmbeddingCache(prefix, embedding_fn)
+        return _caches[key]
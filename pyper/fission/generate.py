@@ -1,98 +1,327 @@
-import json
+import asyncio
+import math
+import os
 import random
 import time
-from concurrent.futures import ThreadPoolExecutor
-from typing import Any, Dict, List, Literal
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Dict, List, Literal, Optional, Sequence
 
-import chromadb
+import numpy as np
 from pydantic import BaseModel
 from tqdm import tqdm
 
-from pyper.llm_api import make_llm_request
+from pyper.checkpoint import Checkpoint
+from pyper.dedup import (
+    AcceptanceRate,
+    DedupIndex,
+    create_index,
+    deduplicate_batch,
+    default_embedding_fn,
+)
+from pyper.embed_cache import get_embedding_cache, save_npy
+from pyper.llm_api import (
+    is_rejected_key_error,
+    make_llm_batch_request,
+    make_llm_request_async,
+    submit_async,
+)
+from pyper.metrics import get_metrics
+from pyper.minhash import MinHashLSH, filter_lexical_duplicates
+from pyper.seed_store import SeedStore
+from pyper.sink import JsonlSink
 
 from .model import ResponseModel
 from .prompt import prompt
 
+ORIGINS = ("breadth", "depth")
+# consecutive failed rounds after which generation gives up
+MAX_FAILED_ROUNDS = 3
+
 
 class FissionGenerator:
     def __init__(self):
-        """Initialize FissionGenerator with chromadb client."""
-        self.chroma = chromadb.Client()
+        """Initialize FissionGenerator with the dedup embedding function."""
+        self.embedding_fn = default_embedding_fn()
+        self.removed = {"lexical": 0, "semantic": 0}
+        self.acceptance = AcceptanceRate()
 
-    def _generate_breadth(self, batch: int, instructions: List) -> Dict[str, Any]:
-        encode_message = [
+    def _build_breadth_prompt(self, batch: int, instructions: str) -> List[Dict]:
+        return [
             {
                 "role": "system",
-                "content": prompt.breadth_prompt.format(
-                    batch=batch,
-                    base_tasks=instructions,
-                ),
+                "content": prompt.breadth_prompt,
             },
             {
                 "role": "user",
-                "content": f"generate exactly {batch} task instructions by following the system promptly exactly.",
+                "content": prompt.breadth_user_prompt.format(
+                    batch=batch,
+                    base_tasks=instructions,
+                ),
             },
         ]
-        return make_llm_request(
-            messages=encode_message,
-            response_format=ResponseModel,
-        )
 
-    def _generate_depth(self, batch: int, instructions: List) -> Dict[str, Any]:
-        encode_message = [
+    def _build_depth_prompt(self, batch: int, instructions: str) -> List[Dict]:
+        return [
             {
                 "role": "system",
-                "content": prompt.depth_prompt.format(
-                    batch=batch,
-                    base_tasks=instructions,
-                ),
+                "content": prompt.depth_prompt,
             },
             {
                 "role": "user",
-                "content": f"generate exactly {batch} task instructions by following the system prompt exactly",
+                "content": prompt.depth_user_prompt.format(
+                    batch=batch,
+                    base_tasks=instructions,
+                ),
             },
         ]
 
-        return make_llm_request(
-            messages=encode_message,
+    async def _generate_breadth(self, batch: int, instructions: str) -> Dict[str, Any]:
+        return await make_llm_request_async(
+            messages=self._build_breadth_prompt(batch, instructions),
+            response_format=ResponseModel,
+            stage="breadth",
+        )
+
+    async def _generate_depth(self, batch: int, instructions: str) -> Dict[str, Any]:
+        return await make_llm_request_async(
+            messages=self._build_depth_prompt(batch, instructions),
+            response_format=ResponseModel,
+            stage="depth",
+        )
+
+    async def _generate_round(
+        self, instructions: str, breadth_batch: int, depth_batch: int
+    ) -> tuple[Dict[str, Any], Dict[str, Any]]:
+        """Request breadth and depth expansions of one sample concurrently."""
+        return await asyncio.gather(
+            self._generate_breadth(batch=breadth_batch, instructions=instructions),
+            self._generate_depth(batch=depth_batch, instructions=instructions),
+        )
+
+    def _submit_round(
+        self,
+        seed_pool: Sequence[Dict],
+        gen_pool: List,
+        num_seed: int,
+        num_generated: int,
+        batch: int,
+    ) -> Future:
+        """Sample a few-shot set and start its round without waiting for it."""
+        parsed_sample = self._sample_tasks(seed_pool, gen_pool, num_seed, num_generated)
+        num_q = int(batch // 2)
+        return submit_async(self._generate_round(parsed_sample, num_q, batch - num_q))
+
+    def _next_rounds(
+        self, in_flight: List[Future]
+    ) -> tuple[List[Future], List[Future]]:
+        """Wait for at least one round and split off every finished one.
+
+        Returns:
+            Finished rounds in submission order and the rounds still in flight
+        """
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        finished = [f for f in in_flight if f in done]
+        return finished, [f for f in in_flight if f not in done]
+
+    def _fill_rounds(
+        self,
+        in_flight: Dict[Future, int],
+        deficit: int,
+        concurrency: int,
+        batch: int,
+        seed_pool: Sequence[Dict],
+        gen_pool: List,
+        num_seed: int,
+        num_generated: int,
+    ):
+        """Start rounds until `concurrency` are in flight or the survivors expected
+        from the rounds in flight cover `deficit`.
+
+        Each new round asks for as many tasks as the observed acceptance rate
+        suggests are needed, capped at `batch`.
+
+        Args:
+            in_flight: Rounds in flight mapped to the number of tasks they request
+            deficit: Tasks still missing from the target
+        """
+        while len(in_flight) < concurrency:
+            missing = deficit - self.acceptance.expected(sum(in_flight.values()))
+            if missing <= 0:
+                break
+            # one breadth and one depth task at least
+            size = max(2, min(batch, self.acceptance.requested(math.ceil(missing))))
+            future = self._submit_round(
+                seed_pool, gen_pool, num_seed, num_generated, size
+            )
+            in_flight[future] = size
+
+    def _generate_rounds_batch(
+        self, samples: List[str], breadth_batch: int, depth_batch: int
+    ) -> List[Dict[str, Any]]:
+        """Request breadth and depth expansions of many samples in one batch job."""
+        messages_list = []
+        for instructions in samples:
+            messages_list.append(
+                self._build_breadth_prompt(breadth_batch, instructions)
+            )
+            messages_list.append(self._build_depth_prompt(depth_batch, instructions))
+
+        return make_llm_batch_request(
+            messages_list=messages_list,
             response_format=ResponseModel,
+            stage="fission",
         )
 
-    def _initialize_chroma(self, seed_pool: List[Dict]):
-        """Initializes chromadb and add seed data for embedding based similarity
+    def _initialize_index(
+        self,
+        seed_pool: Sequence[Dict],
+        backend: str = "numpy",
+        dtype: str = "float32",
+        seed_cache: Optional[str] = None,
+        source_path: Optional[str] = None,
+        batch_size: int = 512,
+    ) -> DedupIndex:
+        """Create the dedup index and add seed data for embedding based similarity
+
+        With a cache the seed embeddings are also stored one row per seed in
+        `<seed_cache>.rows.npy`. Later runs add that matrix to the index as is
+        while it is newer than `source_path` and has a row for every seed, so
+        seeds are neither decoded nor hashed. Otherwise the content-addressed
+        cache embeds only the seeds it has not seen.
 
         Args:
-            seed_pool: List of seed tasks to initialize the collection with
+            seed_pool: Seed tasks to initialize the index with
+            backend: Index backend, `numpy` or `chroma`
+            dtype: Storage type of the numpy index rows
+            seed_cache: Path prefix of the persistent seed embedding cache, seeds
+                are embedded from scratch when not set
+            source_path: Seed file the cache was built from
+            batch_size: Number of seed texts embedded at once
 
         Returns:
-            chromadb.Collection: Initialized collection with seed data
+            DedupIndex: Initialized index with seed data
         """
-        collection = self.chroma.create_collection("generation_pool")
-        seed_texts = [item["instruction"] for item in seed_pool]
+        index = create_index(backend, dtype=dtype, name="generation_pool")
+        rows_path = f"{seed_cache}.rows.npy" if seed_cache else None
+        if (
+            rows_path
+            and len(seed_pool)
+            and os.path.exists(rows_path)
+            and os.path.getmtime(rows_path) >= os.path.getmtime(source_path)
+        ):
+            embeddings = np.load(rows_path, mmap_mode="r")
+            if len(embeddings) == len(seed_pool):
+                print("adding cached seed embeddings to index...")
+                for i in range(0, len(seed_pool), batch_size):
+                    # only chroma stores the documents
+                    texts = (
+                        [item["instruction"] for item in seed_pool[i : i + batch_size]]
+                        if backend == "chroma"
+                        else None
+                    )
+                    index.add(embeddings[i : i + batch_size], texts)
+                return index
 
-        print("adding seed data to chroma...")
-        collection.add(
-            documents=seed_texts, ids=[f"seed_{i}" for i in range(len(seed_texts))]
+        embed = (
+            get_embedding_cache(seed_cache, self.embedding_fn)
+            if seed_cache
+            else self.embedding_fn
         )
 
-        return collection
+        print("adding seed data to index...")
+        rows = []
+        for i in range(0, len(seed_pool), batch_size):
+            texts = [item["instruction"] for item in seed_pool[i : i + batch_size]]
+            embeddings = np.asarray(embed(texts), dtype=np.float32)
+            index.add(embeddings, texts)
+            if rows_path:
+                rows.append(embeddings)
+
+        if seed_cache:
+            embed.save()
+            if rows:
+                save_npy(rows_path, np.concatenate(rows))
+        return index
+
+    def _seed_signatures(
+        self,
+        seed_pool: Sequence[Dict],
+        lsh: MinHashLSH,
+        cache_path: Optional[str] = None,
+        source_path: Optional[str] = None,
+        batch_size: int = 4096,
+    ) -> np.ndarray:
+        """MinHash signatures of the seed tasks, one row per seed.
+
+        With a cache path the signatures are stored in a `.npy` file that later
+        runs memory-map, it is recomputed when `source_path` is newer than it.
+        """
+        if (
+            cache_path
+            and len(seed_pool)
+            and os.path.exists(cache_path)
+            and os.path.getmtime(cache_path) >= os.path.getmtime(source_path)
+        ):
+            signatures = np.load(cache_path, mmap_mode="r")
+            if signatures.shape == (len(seed_pool), lsh.num_perm):
+                return signatures
+
+        print("computing seed MinHash signatures...")
+        signatures = np.zeros((len(seed_pool), lsh.num_perm), dtype=np.uint32)
+        for i in range(0, len(seed_pool), batch_size):
+            texts = [self._lexical_text(t) for t in seed_pool[i : i + batch_size]]
+            signatures[i : i + len(texts)] = lsh.signatures_of(texts)
+        if cache_path:
+            save_npy(cache_path, signatures)
+        return signatures
+
+    def _initialize_lsh(
+        self,
+        seed_pool: Sequence[Dict],
+        threshold: float,
+        num_perm: int,
+        seed_path: Optional[str] = None,
+        seed_cache: bool = False,
+    ) -> MinHashLSH:
+        """Create the MinHash prefilter and add the seed tasks to it
+
+        Args:
+            seed_pool: Seed tasks the prefilter starts with
+            threshold: Estimated Jaccard similarity at which tasks are duplicates
+            num_perm: Number of MinHash permutations
+            seed_path: Seed file the signature cache is kept next to
+            seed_cache: Persist the seed signatures so later runs load them
+        """
+        lsh = MinHashLSH(threshold=threshold, num_perm=num_perm)
+        cache_path = f"{seed_path}.minhash{num_perm}.npy" if seed_cache else None
+        lsh.add_base(self._seed_signatures(seed_pool, lsh, cache_path, seed_path))
+        return lsh
+
+    def _lexical_text(self, task: Dict) -> str:
+        return f"{task['instruction']}\n{task['input']}"
 
     def _deduplicate_instruction(
         self,
         instructions: List,
-        collection: chromadb.Collection,
+        index: DedupIndex,
         pbar: tqdm,
         res_length: int,
         num_tasks: int,
+        lsh: Optional[MinHashLSH] = None,
     ) -> tuple[List, int]:
         """Remove similar tasks based on instruction similarity.
 
+        Candidates first pass the MinHash prefilter, when one is given, so
+        near-verbatim copies are dropped without being embedded. At most
+        `num_tasks - res_length` tasks are accepted.
+
         Args:
             instructions: List of new instructions to deduplicate
-            collection: ChromaDB collection for similarity checking
+            index: Dedup index for similarity checking
             pbar: Progress bar to update
             res_length: Current length of results
             num_tasks: Total number of tasks to generate
+            lsh: MinHash prefilter holding the seed and accepted tasks
 
         Returns:
             tuple containing:
@@ -100,44 +329,80 @@ class FissionGenerator:
             - Count of new tasks added
         """
         print("filtering similar items...")
-        cnt = 0
-        clean_tasks = []
-        for new_inst in instructions:
-            results = collection.query(
-                query_texts=[new_inst["instruction"]], n_results=1
+        remaining = num_tasks - res_length
+        if remaining <= 0:
+            return [], 0
+
+        candidates = instructions
+        if lsh is not None:
+            survivors, signatures = filter_lexical_duplicates(
+                [self._lexical_text(inst) for inst in instructions], lsh
             )
+            candidates = [instructions[i] for i in survivors]
+
+        started = time.monotonic()
+        keep = deduplicate_batch(
+            texts=[inst["instruction"] for inst in candidates],
+            embedding_fn=self.embedding_fn,
+            index=index,
+            limit=remaining,
+        )
+        if lsh is not None:
+            for i in keep:
+                lsh.insert(signatures[i])
+        clean_tasks = [candidates[i] for i in keep]
+        pbar.update(len(clean_tasks))
+        self.acceptance.update(len(instructions), len(keep))
+        metrics = get_metrics()
+        metrics.record_latency("dedup", time.monotonic() - started)
+        metrics.record_accepted("dedup", len(instructions), len(keep))
+
+        self.removed["lexical"] += len(instructions) - len(candidates)
+        self.removed["semantic"] += len(candidates) - len(keep)
+        print(
+            f"removed {len(instructions) - len(candidates)} lexical and "
+            f"{len(candidates) - len(keep)} semantic duplicates"
+        )
 
-            if not results["distances"][0] or results["distances"][0][0] > 0.7:
-                collection.add(
-                    documents=[new_inst["instruction"]],
-                    ids=[f"gen_{time.time()}"],
-                )
-
-                clean_tasks.append(new_inst)
-                pbar.update(1)
-                cnt += 1
-
-            if res_length > num_tasks:
-                return clean_tasks, cnt
+        return clean_tasks, len(clean_tasks)
 
-        return clean_tasks, cnt
+    def _record_accepted(self, candidates: List, origins: List[str], accepted: List):
+        """Record per stage how many of its candidates were accepted."""
+        accepted_ids = {id(task) for task in accepted}
+        counts = {}
+        for task, origin in zip(candidates, origins):
+            total, kept = counts.get(origin, (0, 0))
+            counts[origin] = (total + 1, kept + (id(task) in accepted_ids))
+        metrics = get_metrics()
+        for origin, (total, kept) in counts.items():
+            metrics.record_accepted(origin, total, kept)
 
-    def _create_seed_pool(self, seed_path: str) -> List:
+    def _create_seed_pool(self, seed_path: str) -> SeedStore:
         """Create initial seed pool from file
 
         Args:
-            seed_path: Path to seed data file
+            seed_path: Path to seed data file, optionally gzip or zstd compressed
 
         Returns:
-            List of seed tasks
+            SeedStore: Seed tasks decoded when they are sampled
         """
-        seed_pool = []
-        with open(seed_path, "r") as f:
-            for line in f:
-                if line.strip():
-                    seed_pool.append(json.loads(line))
+        return SeedStore(seed_path)
 
-        return seed_pool
+    def _sample_tasks(
+        self,
+        seed_pool: Sequence[Dict],
+        gen_pool: List,
+        num_seed: int,
+        num_generated: int,
+    ) -> str:
+        """Sample few-shot tasks from the seed and generated pools"""
+        sample_seed = random.sample(seed_pool, num_seed)
+        if gen_pool:
+            gen_samples = random.sample(gen_pool, min(num_generated, len(gen_pool)))
+            combined_sample = sample_seed + gen_samples
+        else:
+            combined_sample = sample_seed
+        return self._parse_samples(samples=combined_sample)
 
     def _parse_samples(self, samples: List):
         template = """# Task {num}: \n instruction: {instruction} \n input: {input} \n output: {output} \n\n"""
@@ -159,6 +424,15 @@ class FissionGenerator:
         batch: int,
         num_seed: int,
         num_generated: int,
+        execution: str = "online",
+        sink: Optional[JsonlSink] = None,
+        checkpoint: Optional[Checkpoint] = None,
+        dedup_backend: str = "numpy",
+        dedup_dtype: str = "float32",
+        seed_embedding_cache: bool = True,
+        minhash_threshold: Optional[float] = 0.8,
+        minhash_num_perm: int = 128,
+        concurrency: int = 1,
     ) -> List:
         """Main generation process.
 
@@ -168,77 +442,198 @@ class FissionGenerator:
             batch (int): How many tasks to generate for each iteration
             num_seed (int): Number of seed tasks to sample in each iteration
             num_generated (int): Number of generated tasks to sample in each iteration
+            execution (str): `online` for concurrent requests or `batch` to send
+                every round needed for the remaining tasks as one Batch API job
+            sink (JsonlSink, optional): Sink that accepted tasks are streamed to
+            checkpoint (Checkpoint, optional): Checkpoint the loop is periodically
+                saved to and resumed from when it holds a state
+            dedup_backend (str): Index used for deduplication, `numpy` or `chroma`
+            dedup_dtype (str): Storage type of the numpy index rows
+            seed_embedding_cache (bool): Keep seed embeddings and MinHash
+                signatures in memory-mapped caches next to the seed file so later
+                runs only embed new seeds and don't sign them again
+            minhash_threshold (float, optional): Jaccard similarity above which
+                the MinHash prefilter drops a candidate, disabled when not set
+            minhash_num_perm (int): Number of MinHash permutations
+            concurrency (int): Sampling rounds kept in flight in online mode.
+                Accepted tasks are merged and deduplicated on the calling thread
 
         Returns:
             List: Generated and filtered tasks
         """
         # Initialize data
         seed_pool = self._create_seed_pool(seed_path)
-        collection = self._initialize_chroma(seed_pool)
-        clean_tasks = []
-        gen_pool = []
-        num_q = int(batch // 2)
+        state = checkpoint.state if checkpoint is not None else None
+        lsh = None
+        if state:
+            print("resuming from checkpoint...")
+            if "seed_rows" in state:
+                # the checkpoint holds the accepted rows, seeds come from the cache
+                index = self._initialize_index(
+                    seed_pool,
+                    dedup_backend,
+                    dedup_dtype,
+                    seed_cache=f"{seed_path}.emb" if seed_embedding_cache else None,
+                    source_path=seed_path,
+                )
+            else:
+                index = create_index(
+                    dedup_backend, dtype=dedup_dtype, name="generation_pool"
+                )
+            index.load(state["index"])
+            random.setstate(state["random_state"])
+            if minhash_threshold:
+                lsh = self._initialize_lsh(
+                    seed_pool,
+                    minhash_threshold,
+                    minhash_num_perm,
+                    seed_path,
+                    seed_embedding_cache,
+                )
+                if state.get("lsh") is not None:
+                    lsh.load(state["lsh"])
+                else:
+                    # checkpoint taken without the prefilter, rebuild it from the text
+                    for task in state["clean_tasks"]:
+                        lsh.insert(lsh.signature(self._lexical_text(task)))
+            self.removed = state.get("removed", self.removed)
+            self.acceptance.rate = state.get("acceptance", self.acceptance.rate)
+            clean_tasks = state["clean_tasks"]
+            # the generation pool holds exactly the accepted tasks
+            gen_pool = list(clean_tasks)
+        else:
+            index = self._initialize_index(
+                seed_pool,
+                dedup_backend,
+                dedup_dtype,
+                seed_cache=f"{seed_path}.emb" if seed_embedding_cache else None,
+                source_path=seed_path,
+            )
+            if minhash_threshold:
+                lsh = self._initialize_lsh(
+                    seed_pool,
+                    minhash_threshold,
+                    minhash_num_perm,
+                    seed_path,
+                    seed_embedding_cache,
+                )
+            clean_tasks = []
+            gen_pool = []
+        in_flight: Dict[Future, int] = {}
+        failed_rounds = 0
+        sampling = (seed_pool, gen_pool, num_seed, num_generated)
 
-        with tqdm(total=num_tasks) as pbar:
+        with tqdm(total=num_tasks, initial=len(clean_tasks)) as pbar:
             print("starting generation...")
             while len(clean_tasks) < num_tasks:
-                sample_seed = random.sample(seed_pool, num_seed)
-                if gen_pool:
-                    gen_samples = random.sample(gen_pool, num_generated)
-                    combined_sample = sample_seed + gen_samples
-                else:
-                    combined_sample = sample_seed
-                parsed_sample = self._parse_samples(samples=combined_sample)
-
                 print("requesting LLM output...")
-                with ThreadPoolExecutor(max_workers=2) as executor:
-                    future_breadth = executor.submit(
-                        self._generate_breadth,
-                        batch=num_q,
-                        instructions=parsed_sample,
+                deficit = num_tasks - len(clean_tasks)
+                if execution == "batch":
+                    needed = self.acceptance.requested(deficit)
+                    rounds = math.ceil(needed / batch)
+                    samples = [
+                        self._sample_tasks(seed_pool, gen_pool, num_seed, num_generated)
+                        for _ in range(rounds)
+                    ]
+                    num_q = int(batch // 2)
+                    responses = self._generate_rounds_batch(
+                        samples, num_q, batch - num_q
                     )
-                    future_depth = executor.submit(
-                        self._generate_depth,
-                        batch=batch - num_q,
-                        instructions=parsed_sample,
+                else:
+                    self._fill_rounds(in_flight, deficit, concurrency, batch, *sampling)
+                    finished, _ = self._next_rounds(list(in_flight))
+                    finished_size = sum(in_flight.pop(f) for f in finished)
+                    # top up before deduplicating, so the next few-shot sets are
+                    # sampled while this batch is filtered
+                    self._fill_rounds(
+                        in_flight,
+                        deficit - self.acceptance.expected(finished_size),
+                        concurrency,
+                        batch,
+                        *sampling,
                     )
-
-                    b_inst = future_breadth.result()
-                    d_inst = future_depth.result()
+                    responses = []
+                    for future in finished:
+                        try:
+                            responses.extend(future.result())
+                            failed_rounds = 0
+                        except Exception as e:
+                            failed_rounds += 1
+                            # a rejected key fails every round the same way
+                            if (
+                                is_rejected_key_error(e)
+                                or failed_rounds >= MAX_FAILED_ROUNDS
+                            ):
+                                for f in in_flight:
+                                    f.cancel()
+                                raise
+                            print(f"round failed: {e}")
 
                 generated_inst = []
-                generated_inst.extend(
-                    [
-                        {
-                            "instruction": i["instruction"],
-                            "input": i["input"],
-                            "output": i["output"],
-                        }
-                        for i in b_inst["tasks"]
-                    ]
-                )
-                generated_inst.extend(
-                    [
-                        {
-                            "instruction": i["instruction"],
-                            "input": i["input"],
-                            "output": i["output"],
-                        }
-                        for i in d_inst["tasks"]
-                    ]
-                )
+                origins = []
+                for n, res in enumerate(responses):
+                    if res is None:
+                        continue
+                    generated_inst.extend(
+                        [
+                            {
+                                "instruction": i["instruction"],
+                                "input": i["input"],
+                                "output": i["output"],
+                            }
+                            for i in res["tasks"]
+                        ]
+                    )
+                    # responses alternate breadth and depth expansions
+                    origin = "fission" if execution == "batch" else ORIGINS[n % 2]
+                    origins.extend([origin] * len(res["tasks"]))
                 print(f"# generated questions: {len(generated_inst)}")
                 filtered, cnt = self._deduplicate_instruction(
                     instructions=generated_inst,
-                    collection=collection,
+                    index=index,
                     pbar=pbar,
                     res_length=len(clean_tasks),
                     num_tasks=num_tasks,
+                    lsh=lsh,
                 )
                 print(f"# questions after filtering: {cnt}")
+                if execution == "batch":
+                    # an expired or failed job returns no responses, and every
+                    # new job would fail the same way
+                    failed_rounds = 0 if filtered else failed_rounds + 1
+                    if failed_rounds >= MAX_FAILED_ROUNDS:
+                        raise RuntimeError(
+                            f"{failed_rounds} batch jobs in a row produced no new tasks"
+                        )
+                self._record_accepted(generated_inst, origins, filtered)
+                if sink is not None:
+                    sink.write_many(filtered)
                 # add to result list
                 clean_tasks.extend(filtered)
                 # add to pool for sampling
                 gen_pool.extend(filtered)
 
+                if checkpoint is not None and checkpoint.due():
+                    checkpoint.save(
+                        {
+                            "clean_tasks": clean_tasks,
+                            "random_state": random.getstate(),
+                            # seed rows are rebuilt from the seed embedding cache
+                            "index": index.dump(start=len(seed_pool)),
+                            "seed_rows": len(seed_pool),
+                            "lsh": lsh.dump() if lsh is not None else None,
+                            "removed": self.removed,
+                            "acceptance": self.acceptance.rate,
+                            "sink_offset": sink.tell() if sink is not None else None,
+                        }
+                    )
+
+        # the target is met, requests still in flight would only be discarded
+        for future in in_flight:
+            future.cancel()
+        print(
+            f"dedup removed {self.removed['lexical']} candidates in the MinHash "
+            f"prefilter and {self.removed['semantic']} in the embedding index"
+        )
+        seed_pool.close()
         return clean_tasks
@@ -1,6 +1,6 @@
 breadth_prompt = """
 You are an expert prompt engineer responsible for generating instruction tasks for building dataset.
-Your job is to create exactly {batch} creative version of new tasks inspired by the base tasks given.
+Your job is to create the requested number of creative versions of new tasks inspired by the base tasks given by the user.
 
 Generation Guideline:
 1. New task should be in the same domain as the information in the base tasks.
@@ -8,6 +8,9 @@ Generation Guideline:
 3. The new task has equal level of difficulty as the original task
 4. The new task has the similar length to the original task.
 5. The new task only has factual information and is logically understandable by human
+"""
+
+breadth_user_prompt = """Generate exactly {batch} task instructions by following the system prompt exactly.
 
 Here are the base tasks:
 {base_tasks}
@@ -15,7 +18,7 @@ Here are the base tasks:
 
 depth_prompt = """
 You are an expert prompt engineer responsible for generating instruction tasks for building dataset.
-Your job is to create exactly {batch} complex version of new tasks inspired by the base tasks given.
+Your job is to create the requested number of complex versions of new tasks inspired by the base tasks given by the user.
 
 
 Generation Guideline:
@@ -23,7 +26,10 @@ Generation Guideline:
 2. The new task has increased complexity in both information and sentence structure.
 3. The new task has similar length to the original task
 4. The new task only has factual information and is logically understandable by human
+"""
 
-Here are the base task:
+depth_user_prompt = """Generate exactly {batch} task instructions by following the system prompt exactly.
+
+Here are the base tasks:
 {base_tasks}
 """
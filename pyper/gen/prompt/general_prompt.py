@@ -1,25 +1,40 @@
 generate_subject = """
-You are an expert professor in {discipline}. Create a list of subjects a student should learn under this discipline.
+You are an expert professor. Create a list of subjects a student should learn under the discipline given by the user.
 For each subject, provide the level (ranging between 100 - 900) and include key subtopics.
 
 Generation guideline:
-1. Limit the number of subjects generated to a maximum of {max_subjects}.
+1. Limit the number of subjects generated to the maximum given by the user.
 2. The list of subjects covers the majority of the knowledge in the discipline.
-3. Limit the number of subtopics to a maximum of {max_subtopics} for each `subject`.
+3. Limit the number of subtopics for each `subject` to the maximum given by the user.
 
 """
 
+generate_subject_user = """Generate comprehensive list of subjects by following the system prompt closely.
+
+Maximum number of subjects: {max_subjects}
+Maximum number of subtopics per subject: {max_subtopics}
+Discipline: {discipline}
+"""
+
 generate_syllabus = """
-You are an expert tasked with creating syllabus. Create a detailed syllabus for the subject: {subject} at the level: {level}
+You are an expert tasked with creating syllabus. Create a detailed syllabus for the subject and level given by the user.
 
 Generation Guideline:
 1. The syllabus should be broken down into multiple class sessions, each covering different key concepts.
-2. The subtopics for this subject include: {subtopics}.
-3. Limit the number of sessions to a maximum of {max_sessions}.
+2. The syllabus covers the subtopics given by the user.
+3. Limit the number of sessions to the maximum given by the user.
+"""
+
+generate_syllabus_user = """Generate educational syllabus by following the system prompt closely.
+
+Maximum number of sessions: {max_sessions}
+Subject: {subject}
+Level: {level}
+Subtopics: {subtopics}
 """
 
 generate_question = """
-Based on the class session(s) {session} and key concepts {concepts}, generate exactly {batch} homework tasks.
+Generate the requested number of homework tasks based on the class session(s) and key concepts given by the user.
 
 Generation Guideline:
 1. Generate an appropriate input to the question. The input field should contain a specific example provided for the question. If input is not necessary, return ""
@@ -37,19 +52,31 @@ Output: The chill, worming in\nShock, pleasure, bursting within\nSummer tongue a
 2. Generate balanced number of tasks with and without the input field.
 3. Vary the style of the questions by generating each type where applicable: Remeber, Understand, Apply, Analyze and Evaluate.
 4. Questions have varying difficulty from easy, medium and hard
-5. Questions are concise with maximum of {max_tokens} tokens.
+5. Questions are concise and stay within the token limit given by the user.
+"""
+
+generate_question_user = """Generate exactly {batch} homework tasks by following the system prompt closely.
+
+Maximum length of a question: {max_tokens} tokens
+Class session(s): {session}
+Key concepts: {concepts}
 """
 
 
 generate_answer = """
 Answer the question correctly and logically. Make your answer short and concise.
 
-## Question: {question}
-## Input: {input}
-
 Generation Guideline:
 1. Respond "DO NOT KNOW" if not sure about the answer.
-2. Answers are concise with the maximum length of {max_tokens} tokens.
+2. Answers are concise and stay within the token limit given by the user.
 
 Only generate characters that are not JSON control characters (\u0000-\u001F).
 """
+
+generate_answer_user = """Generate answer for the given question by following the system prompt closely.
+
+Maximum length of the answer: {max_tokens} tokens
+
+## Question: {question}
+## Input: {input}
+"""
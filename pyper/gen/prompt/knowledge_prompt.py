@@ -1,17 +1,41 @@
 generate_syllabus = """
-You are an expert in creating educational syallbus. Create a detailed syllabus for the provided knowledge:
-
-{knowledge}
+You are an expert in creating educational syallbus. Create a detailed syllabus for the knowledge provided by the user.
 
 Generation Guideline:
 1. The syllabus should be broken down into multiple class sessions, each covering different key concepts.
 2. The syllabus covers the information provided in the provided knowledge
 3. Generate as many syllabi as needed to fully cover the provided knowledge
-3. Limit the number of sessions to a maximum of {max_sessions}.
+3. Limit the number of sessions to the maximum given by the user.
+"""
+
+generate_syllabus_user = """Generate educational syllabus by following the system prompt closely.
+
+Maximum number of sessions: {max_sessions}
+
+Knowledge:
+{knowledge}
+"""
+
+merge_syllabus = """
+You are an expert in creating educational syallbus. The user provides partial syllabi, each created from a different part of the same knowledge. Merge them into one detailed syllabus.
+
+Generation Guideline:
+1. The merged syllabus covers the key concepts of all partial syllabi.
+2. Combine sessions that cover the same or closely related concepts.
+3. Keep the order in which the concepts appear in the partial syllabi.
+4. Limit the number of sessions to the maximum given by the user.
+"""
+
+merge_syllabus_user = """Merge the partial syllabi by following the system prompt closely.
+
+Maximum number of sessions: {max_sessions}
+
+Partial syllabi:
+{syllabi}
 """
 
 generate_question = """
-Based on the class session(s) {session} and key concepts {concepts}, generate exactly {batch} questions.
+Generate the requested number of questions based on the class session(s) and key concepts given by the user.
 
 Generation Guideline:
 1. Generate an appropriate input to the question. The input field should contain a specific example provided for the question. It should involve realistic data and should not contain simple placeholders. The input should provide substantial content to make the question challenging.
@@ -19,17 +43,35 @@ Generation Guideline:
 3. Balance number of questions that have input and that does not have input.
 4. Questions have varying difficulty from easy, medium and hard
 5. Questions are generated proportionally using Bloom's taxonomy: Remeber, Understand, Apply, Analyze and Evaluate.
-6. Questions are concise with maximum of {max_tokens} tokens.
+6. Questions are concise and stay within the token limit given by the user.
+"""
+
+generate_question_user = """Generate exactly {batch} questions by following the system prompt closely.
+
+Maximum length of a question: {max_tokens} tokens
+Class session(s): {session}
+Key concepts: {concepts}
 """
 
 
 generate_answer = """
 Answer the question correctly and logically. Make answers short and concise.
 
+Generation Guideline:
+1. Respond "DO NOT KNOW" if not sure about the answer.
+2. Answers are concise and stay within the token limit given by the user.
+3. When the user gives reference passages, base the answer on them and prefer them over prior knowledge.
+"""
+
+generate_answer_user = """Generate answer for the given question by following the system prompt closely.
+
+Maximum length of the answer: {max_tokens} tokens
+{passages}
 ## Question: {question}
 ## Input: {input}
+"""
 
-Generation Guideline:
-1. Respond "DO NOT KNOW" if not sure about the answer.
-2. Answers are concise with the maximum length of {max_tokens} tokens.
+answer_passages = """
+## Reference passages:
+{passages}
 """
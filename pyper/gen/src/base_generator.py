@@ -1,132 +1,476 @@
-import concurrent.futures
-import json
+import asyncio
+import math
 import random
+import threading
 import time
 from abc import ABC, abstractmethod
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional, Tuple
 
-import chromadb
+import numpy as np
+from tqdm import tqdm
 
-from pyper.llm_api import make_llm_request
+from pyper.checkpoint import Checkpoint
+from pyper.dedup import (
+    AcceptanceRate,
+    create_index,
+    deduplicate_batch,
+    default_embedding_fn,
+)
+from pyper.embed_cache import get_embedding_cache
+from pyper.llm_api import (
+    make_llm_batch_request,
+    make_llm_request_async,
+    run_async,
+)
+from pyper.metrics import get_metrics
+from pyper.minhash import MinHashLSH, filter_lexical_duplicates
+from pyper.retrieval import PassageIndex
+from pyper.sink import JsonlSink
+from pyper.work_queue import WorkQueue
 
 
 class BaseGenerator(ABC):
     def __init__(self):
-        self.chroma = chromadb.Client()
-        self.collection = self.chroma.create_collection("question")
+        self.embedding_fn = default_embedding_fn()
+        self.index = create_index("numpy", name="question")
+        self.lsh: Optional[MinHashLSH] = None
+        self.removed = {"lexical": 0, "semantic": 0}
+        # answers of accepted questions keyed by their position in the task list
+        self.answers: Dict[int, Dict] = {}
+        # keeps the sink offset in step with the answers taken into checkpoints
+        self._answers_lock = threading.Lock()
+        self.acceptance = AcceptanceRate()
+        # passages answers are grounded in, set by generators with a corpus
+        self.passages: Optional[PassageIndex] = None
+        self.retrieval_top_k = 0
 
-    def _generate_question_task(
+    def _init_index(
+        self,
+        backend: str,
+        dtype: str,
+        embedding_cache: Optional[str] = None,
+        minhash_threshold: Optional[float] = None,
+        minhash_num_perm: int = 128,
+        namespace: str = "question",
+    ):
+        """Create a fresh dedup index for a generation run
+
+        Args:
+            backend: Index backend, `numpy` or `chroma`
+            dtype: Storage type of the numpy index rows
+            embedding_cache: Path prefix of the persistent question embedding cache
+            minhash_threshold: Jaccard similarity above which the MinHash
+                prefilter drops a question before embedding, disabled when not set
+            minhash_num_perm: Number of MinHash permutations
+            namespace: Name of the index, keeps the collections of generators
+                running in the same process apart
+        """
+        self.index = create_index(backend, dtype=dtype, name=namespace)
+        self.lsh = (
+            MinHashLSH(threshold=minhash_threshold, num_perm=minhash_num_perm)
+            if minhash_threshold
+            else None
+        )
+        self.removed = {"lexical": 0, "semantic": 0}
+        self.answers = {}
+        self.acceptance = AcceptanceRate()
+        self.passages = None
+        if embedding_cache:
+            self.embedding_fn = get_embedding_cache(
+                embedding_cache, default_embedding_fn()
+            )
+
+    def _save_embeddings(self):
+        if hasattr(self.embedding_fn, "save"):
+            self.embedding_fn.save()
+
+    async def _generate_session_questions(
+        self, session: Dict, batch: int, max_tokens: int, params: Dict
+    ) -> Dict:
+        encode_message = self._build_question_prompt(
+            session=session["session_name"],
+            concepts=session["key_concepts"],
+            batch=batch,
+            max_tokens=max_tokens,
+        )
+        return await make_llm_request_async(
+            messages=encode_message,
+            response_format=self.question_schema,
+            stage="question",
+            **params,
+        )
+
+    async def _generate_questions_async(
         self,
         syllabus,
         batch: int,
         knowledge: bool,
         max_tokens: int = 150,
-    ):
-        """Generate question by randomly selecting one syllabi from generated syllabus."""
-        questions = []
-        # Randomly select one syllabus
-        syl = syllabus if knowledge else random.choice(syllabus)
-
-        # Generate questions for each session in the selected syllabus
-        for s in syl["syllabus"]:
-            session = s["session_name"]
-            concepts = s["key_concepts"]
-
-            encode_message = self._build_question_prompt(
-                session=session,
-                concepts=concepts,
-                batch=batch,
-                max_tokens=max_tokens,
-            )
+        syllabi_per_iteration: int = 1,
+        deficit: Optional[int] = None,
+    ) -> List:
+        # syllabi and sampling params are drawn before any request is sent, so the
+        # RNG sequence and the merged order don't depend on response timing
+        picked = [
+            syllabus if knowledge else random.choice(syllabus)
+            for _ in range(syllabi_per_iteration)
+        ]
+        if deficit is not None:
+            # ask each session only for its share of what is still missing
+            num_sessions = sum(len(syl["syllabus"]) for syl in picked)
+            needed = self.acceptance.requested(deficit)
+            batch = max(1, min(batch, math.ceil(needed / max(num_sessions, 1))))
 
-            res = make_llm_request(
-                messages=encode_message,
-                response_format=self.question_schema,
-                temperature=random.choice([0.6, 0.8, 1.0, 1.2]),
-                frequency_penalty=random.choice([0.6, 0.8, 1.0, 1.2]),
-            )
+        jobs = []
+        for syl in picked:
+            for s in syl["syllabus"]:
+                params = {
+                    "temperature": random.choice([0.6, 0.8, 1.0, 1.2]),
+                    "frequency_penalty": random.choice([0.6, 0.8, 1.0, 1.2]),
+                }
+                jobs.append(
+                    self._generate_session_questions(s, batch, max_tokens, params)
+                )
+
+        questions = []
+        for res in await asyncio.gather(*jobs):
             questions.extend(res["questions"])
 
             print(res)
             print("")
         return questions
 
-    def _process_single_answer(self, question: Dict, max_tokens: int = 150) -> Dict:
+    def _generate_question_task(
+        self,
+        syllabus,
+        batch: int,
+        knowledge: bool,
+        max_tokens: int = 150,
+        syllabi_per_iteration: int = 1,
+        deficit: Optional[int] = None,
+    ):
+        """Generate questions for every session of randomly selected syllabi.
+
+        All sessions are requested concurrently under the shared rate limit and
+        merged in syllabus and session order. When `deficit` is set the per
+        session batch shrinks to what the observed dedup acceptance rate says is
+        needed to cover it.
+        """
+        return run_async(
+            self._generate_questions_async(
+                syllabus, batch, knowledge, max_tokens, syllabi_per_iteration, deficit
+            )
+        )
+
+    def _answer_passages(self, questions: List[Dict]) -> List[Optional[List[str]]]:
+        """Passages retrieved for each question, None when retrieval is off."""
+        if self.passages is None or self.retrieval_top_k <= 0:
+            return [None] * len(questions)
+        return self.passages.search(
+            [f"{q['question']}\n{q['input']}" for q in questions],
+            k=self.retrieval_top_k,
+        )
+
+    async def _process_single_answer(
+        self, question: Dict, max_tokens: int = 150
+    ) -> Dict:
         q = question["question"]
         input = question["input"]
+        # embedding the question is CPU work, keep it off the event loop
+        passages = (await asyncio.to_thread(self._answer_passages, [question]))[0]
 
         encode_message = self._build_answer_prompt(
             question=q,
             input=input,
             max_tokens=max_tokens,
+            passages=passages,
         )
 
-        return make_llm_request(
+        return await make_llm_request_async(
             messages=encode_message,
             response_format=self.answer_schema,
+            stage="answer",
         )
 
-    def _generate_answers(self, question_tasks: List, max_tokens: int = 150):
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            # keep track of the order
-            futures_dict = {
-                executor.submit(self._process_single_answer, question, max_tokens): i
-                for i, question in enumerate(question_tasks)
-            }
+    async def _answer_task(
+        self, item: Tuple[int, Dict], max_tokens: int, sink: Optional[JsonlSink]
+    ):
+        i, question = item
+        answer = await self._process_single_answer(question, max_tokens)
+        # the sink fsyncs periodically, keep the write off the event loop
+        await asyncio.to_thread(self._store_answer, i, question, answer, sink)
 
-            answers = [None] * len(question_tasks)
+    def _store_answer(
+        self, i: int, question: Dict, answer: Dict, sink: Optional[JsonlSink]
+    ):
+        with self._answers_lock:
+            if sink is not None:
+                sink.write(self._build_record(question, answer))
+            self.answers[i] = answer
 
-            # collect results as they complete and place in correct position
-            for future in concurrent.futures.as_completed(futures_dict):
-                original_index = futures_dict[future]
-                try:
-                    result = future.result()
-                    answers[original_index] = result
-                except Exception as e:
-                    print(f"Error processing question at index {original_index}: {e}")
-                    answers[original_index] = None
-        return answers
+    def _start_answer_queue(
+        self,
+        sink: Optional[JsonlSink],
+        max_tokens: int = 150,
+        num_workers: int = 64,
+        max_pending: int = 256,
+    ) -> WorkQueue:
+        """Start answer workers that drain accepted questions while more are generated."""
+        queue = WorkQueue(
+            lambda item: self._answer_task(item, max_tokens, sink),
+            num_workers=num_workers,
+            max_pending=max_pending,
+        )
+        queue.start()
+        return queue
+
+    def _enqueue_answers(self, queue: Optional[WorkQueue], tasks: List, start: int = 0):
+        """Queue `tasks[start:]` for answering, skipping questions already answered."""
+        if queue is None:
+            return
+        for i in range(start, len(tasks)):
+            if i not in self.answers:
+                queue.put((i, tasks[i]))
+
+    def _generate_answers_batch(
+        self, question_tasks: List, max_tokens: int = 150
+    ) -> List:
+        passages = self._answer_passages(question_tasks)
+        messages_list = [
+            self._build_answer_prompt(
+                question=q["question"],
+                input=q["input"],
+                max_tokens=max_tokens,
+                passages=p,
+            )
+            for q, p in zip(question_tasks, passages)
+        ]
+        return make_llm_batch_request(
+            messages_list=messages_list,
+            response_format=self.answer_schema,
+            stage="answer",
+        )
+
+    def _finish_answers(
+        self,
+        question_tasks: List,
+        queue: Optional[WorkQueue],
+        sink: Optional[JsonlSink] = None,
+        max_tokens: int = 150,
+    ) -> List:
+        """Wait for the answer workers, or answer everything through the Batch API
+        when no queue was started, and return the finished records in question order.
+        """
+        if queue is None:
+            answers = self._generate_answers_batch(question_tasks, max_tokens)
+            self.answers = {i: a for i, a in enumerate(answers) if a is not None}
+        else:
+            print("waiting for remaining answers...")
+            queue.join()
+            if queue.failed:
+                print(f"dropped {len(queue.failed)} questions whose answers failed")
+
+        get_metrics().record_accepted("answer", len(question_tasks), len(self.answers))
+        dataset = [
+            self._build_record(question_tasks[i], self.answers[i])
+            for i in sorted(self.answers)
+        ]
+        if queue is None and sink is not None:
+            sink.write_many(dataset)
+        return dataset
+
+    def _run_question_loop(
+        self,
+        generate_questions: Callable[[int], List],
+        clean_tasks: List,
+        num_tasks: int,
+        execution: str,
+        sink: Optional[JsonlSink],
+        checkpoint: Optional[Checkpoint],
+        state: Dict,
+        answer_workers: int = 64,
+        answer_queue_size: int = 256,
+        on_questions_done: Optional[Callable[[List], None]] = None,
+    ) -> List:
+        """Generate questions until `num_tasks` are accepted and answer them.
+
+        Online answers are produced by workers while the question loop is still
+        running, batch answers are requested once every question exists.
+
+        Args:
+            generate_questions: Returns candidate questions for the number of
+                tasks still missing
+            clean_tasks: Tasks accepted so far, extended in place
+            num_tasks: Number of tasks to accept
+            execution: `online` or `batch`
+            sink: Sink finished records are streamed to
+            checkpoint: Checkpoint the loop is periodically saved to
+            state: Generator state saved with every checkpoint
+            answer_workers: Answers requested concurrently
+            answer_queue_size: Accepted questions waiting for an answer before
+                question generation blocks
+            on_questions_done: Called with the accepted tasks once the question
+                loop finished
+
+        Returns:
+            Finished records in question order
+        """
+        queue = None
+        if execution != "batch":
+            queue = self._start_answer_queue(
+                sink, num_workers=answer_workers, max_pending=answer_queue_size
+            )
+            self._enqueue_answers(queue, clean_tasks)
+
+        try:
+            with tqdm(total=num_tasks, initial=len(clean_tasks)) as pbar:
+                while len(clean_tasks) < num_tasks:
+                    print("generating questions...")
+                    q_res = generate_questions(num_tasks - len(clean_tasks))
+                    clean_t = self._deduplicate_task(
+                        q_res, limit=num_tasks - len(clean_tasks)
+                    )
+                    clean_tasks.extend(clean_t)
+                    self._enqueue_answers(
+                        queue, clean_tasks, len(clean_tasks) - len(clean_t)
+                    )
+                    pbar.update(len(clean_t))
+
+                    if checkpoint is not None and checkpoint.due():
+                        self._save_checkpoint(
+                            checkpoint, sink, **state, clean_tasks=clean_tasks
+                        )
+
+            self._save_embeddings()
+            self._report_dedup()
+            if on_questions_done is not None:
+                on_questions_done(clean_tasks)
+            if checkpoint is not None:
+                # questions are complete, a crash while answering only redoes open answers
+                self._save_checkpoint(
+                    checkpoint, sink, **state, clean_tasks=clean_tasks
+                )
+
+            print("generating answers...")
+            return self._finish_answers(clean_tasks, queue, sink)
+        finally:
+            # workers left running would keep answering into a closed sink
+            if queue is not None:
+                queue.cancel()
 
     def _deduplicate_task(
         self,
         new_tasks: List,
+        limit: Optional[int] = None,
     ):
         """
         Filter similar task by calculating similarity score of questions.
+        At most `limit` tasks are accepted.
         """
         print("filtering similar questions...")
-        clean_questions = []
-        for i, q in enumerate(new_tasks):
-            res = self.collection.query(query_texts=[q["question"]], n_results=1)
-            if not res["distances"][0] or res["distances"][0][0] > 0.7:
-                self.collection.add(
-                    documents=[q["question"]], ids=[f"gen_{time.time()}"]
-                )
-                # add the entire task to the result set
-                clean_questions.append(q)
-        return clean_questions
+        candidates = new_tasks
+        if self.lsh is not None:
+            # cheap lexical pass so near-verbatim copies are never embedded
+            survivors, signatures = filter_lexical_duplicates(
+                [f"{q['question']}\n{q['input']}" for q in new_tasks], self.lsh
+            )
+            candidates = [new_tasks[i] for i in survivors]
+
+        started = time.monotonic()
+        keep = deduplicate_batch(
+            texts=[q["question"] for q in candidates],
+            embedding_fn=self.embedding_fn,
+            index=self.index,
+            limit=limit,
+        )
+        if self.lsh is not None:
+            for i in keep:
+                self.lsh.insert(signatures[i])
+
+        self.acceptance.update(len(new_tasks), len(keep))
+        metrics = get_metrics()
+        metrics.record_latency("dedup", time.monotonic() - started)
+        metrics.record_accepted("dedup", len(new_tasks), len(keep))
+        metrics.record_accepted("question", len(new_tasks), len(keep))
+        self.removed["lexical"] += len(new_tasks) - len(candidates)
+        self.removed["semantic"] += len(candidates) - len(keep)
+        print(
+            f"removed {len(new_tasks) - len(candidates)} lexical and "
+            f"{len(candidates) - len(keep)} semantic duplicates"
+        )
+        # add the entire task to the result set
+        return [candidates[i] for i in keep]
+
+    def _seed_index(self, questions: List[Dict]):
+        """Add questions accepted in earlier runs so they are not generated again."""
+        if not questions:
+            return
+        print(f"deduplicating against {len(questions)} earlier questions...")
+        texts = [q["question"] for q in questions]
+        self.index.add(np.asarray(self.embedding_fn(texts), dtype=np.float32), texts)
+        if self.lsh is not None:
+            for q in questions:
+                self.lsh.insert(self.lsh.signature(f"{q['question']}\n{q['input']}"))
+
+    def _report_dedup(self):
+        print(
+            f"dedup removed {self.removed['lexical']} candidates in the MinHash "
+            f"prefilter and {self.removed['semantic']} in the embedding index"
+        )
+
+    def _save_checkpoint(
+        self, checkpoint: Checkpoint, sink: Optional[JsonlSink], **state
+    ):
+        """Persist loop state together with the RNG, dedup index, answers and sink offset."""
+        self._save_embeddings()
+        answers, sink_offset = self._snapshot_answers(sink)
+        checkpoint.save(
+            {
+                **state,
+                "random_state": random.getstate(),
+                "index": self.index.dump(),
+                "lsh": self.lsh.dump() if self.lsh is not None else None,
+                "removed": self.removed,
+                "acceptance": self.acceptance.rate,
+                "answers": answers,
+                "sink_offset": sink_offset,
+            }
+        )
+
+    def _snapshot_answers(self, sink: Optional[JsonlSink]):
+        # no answer is stored between the two reads
+        with self._answers_lock:
+            return dict(self.answers), sink.tell() if sink is not None else None
+
+    def _restore_checkpoint(self, state: Dict):
+        print("resuming from checkpoint...")
+        random.setstate(state["random_state"])
+        self.index.load(state["index"])
+        if self.lsh is not None and state.get("lsh") is not None:
+            self.lsh.load(state["lsh"])
+        self.removed = state.get("removed", self.removed)
+        self.answers = state.get("answers", {})
+        self.acceptance.rate = state.get("acceptance", self.acceptance.rate)
 
     def save_results(self, questions: List, answers: List, output_path: str):
         """Common method to save results"""
-        with open(output_path, "w") as f:
-            for q, a in zip(questions, answers):
-                d = {
-                    "instruction": q["question"],
-                    "input": q["input"],
-                    "output": a["answer"],
-                }
-                f.write(json.dumps(d) + "\n")
+        with JsonlSink(output_path) as sink:
+            sink.write_many(self._build_dataset(questions, answers))
+
+    def _build_record(self, question: Dict, answer: Dict) -> Dict:
+        return {
+            "instruction": question["question"],
+            "input": question["input"],
+            "output": answer["answer"],
+        }
 
     def _build_dataset(self, questions: List, answers: List) -> List:
         res = []
         for q, a in zip(questions, answers):
-            res.append(
-                {
-                    "instruction": q["question"],
-                    "input": q["input"],
-                    "output": a["answer"],
-                }
-            )
+            if a is None:
+                # answer failed even after retries
+                continue
+            res.append(self._build_record(q, a))
         return res
 
     @abstractmethod
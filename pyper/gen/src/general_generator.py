@@ -1,9 +1,10 @@
 import json
-from typing import List
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Dict, List, Optional
 
-from tqdm import tqdm
-
-from pyper.llm_api import make_llm_request
+from pyper.checkpoint import Checkpoint
+from pyper.llm_api import make_llm_request, make_llm_request_async, submit_async
+from pyper.sink import JsonlSink
 
 from .. import model
 from ..prompt import general_prompt as prompt
@@ -22,6 +23,17 @@ class GeneralGenerator(BaseGenerator):
         max_subtopics: int,
         max_sessions: int,
         num_questions: int,
+        execution: str = "online",
+        sink: Optional[JsonlSink] = None,
+        checkpoint: Optional[Checkpoint] = None,
+        dedup_backend: str = "numpy",
+        dedup_dtype: str = "float32",
+        embedding_cache: Optional[str] = None,
+        minhash_threshold: Optional[float] = 0.8,
+        minhash_num_perm: int = 128,
+        answer_workers: int = 64,
+        answer_queue_size: int = 256,
+        syllabi_per_iteration: int = 1,
     ):
         """Generate tasks and answers for a given discipline.
 
@@ -32,45 +44,91 @@ class GeneralGenerator(BaseGenerator):
             max_subtopics (int): Maximum number of subtopics per subject
             max_sessions (int): Maximum number of sessions per syllabus
             num_questions (int): Number of questions to generate per batch
+            execution (str): `online` for concurrent requests or `batch` to
+                generate answers through the Batch API
+            sink (JsonlSink, optional): Sink that finished records are streamed to
+            checkpoint (Checkpoint, optional): Checkpoint the question loop is
+                periodically saved to and resumed from when it holds a state
+            dedup_backend (str): Index used for deduplication, `numpy` or `chroma`
+            dedup_dtype (str): Storage type of the numpy index rows
+            embedding_cache (str, optional): Path prefix of the persistent cache
+                for question embeddings
+            minhash_threshold (float, optional): Jaccard similarity above which
+                the MinHash prefilter drops a question, disabled when not set
+            minhash_num_perm (int): Number of MinHash permutations
+            answer_workers (int): Answers requested concurrently while questions
+                are still being generated
+            answer_queue_size (int): Accepted questions waiting for an answer
+                before question generation blocks
+            syllabi_per_iteration (int): Syllabi whose sessions are requested
+                concurrently in each iteration of the question loop
 
         Returns:
             tuple: A tuple containing (clean_tasks, answers) where:
                 - clean_tasks: List of deduplicated question tasks
                 - answers: List of corresponding answers for each task
         """
-        print("generating subjects...")
-        subjects = self._generate_subject(
-            discipline=discipline,
-            max_subjects=max_subjects,
-            max_subtopics=max_subtopics,
-        )
-        print("generating syllabus...")
-        syllabus = self._generate_syllabus(
-            subjects=subjects,
-            max_sessions=max_sessions,
+        self._init_index(
+            dedup_backend,
+            dedup_dtype,
+            embedding_cache,
+            minhash_threshold,
+            minhash_num_perm,
+            namespace=f"question_{discipline}",
         )
+        state = checkpoint.state if checkpoint is not None else None
+        if state:
+            self._restore_checkpoint(state)
+            subjects = state["subjects"]
+            syllabus = state["syllabus"]
+            clean_tasks = state["clean_tasks"]
+            # syllabi still in flight when the checkpoint was taken
+            pending = self._generate_syllabus(
+                subjects=subjects,
+                max_sessions=max_sessions,
+                missing=[i for i, syl in enumerate(syllabus) if syl is None],
+            )
+        else:
+            print("generating subjects...")
+            subjects = self._generate_subject(
+                discipline=discipline,
+                max_subjects=max_subjects,
+                max_subtopics=max_subtopics,
+            )
+            print("generating syllabus...")
+            pending = self._generate_syllabus(
+                subjects=subjects,
+                max_sessions=max_sessions,
+            )
+            syllabus = [None] * len(subjects["subjects"])
+            clean_tasks = []
 
-        clean_tasks = []
-        with tqdm(total=num_tasks) as pbar:
-            while len(clean_tasks) < num_tasks - 1:
-                print("generating questions...")
-                try:
-                    q_res = self._generate_question_task(
-                        syllabus=syllabus,
-                        batch=num_questions,
-                        knowledge=False,
-                    )
-                except Exception:
-                    raise
-
-                clean_t = self._deduplicate_task(q_res)
-                clean_tasks.extend(clean_t)
-                pbar.update(len(clean_t))
+        def generate_questions(deficit: int) -> List:
+            return self._generate_question_task(
+                syllabus=self._collect_syllabus(pending, syllabus),
+                batch=num_questions,
+                deficit=deficit,
+                knowledge=False,
+                syllabi_per_iteration=syllabi_per_iteration,
+            )
 
-        print("generating answers...")
-        answers = self._generate_answers(question_tasks=clean_tasks)
+        def cancel_syllabi(clean_tasks: List):
+            for future in pending.values():
+                # enough questions came from the syllabi that arrived in time
+                future.cancel()
 
-        return self._build_dataset(clean_tasks, answers)
+        return self._run_question_loop(
+            generate_questions,
+            clean_tasks,
+            num_tasks,
+            execution,
+            sink,
+            checkpoint,
+            state={"subjects": subjects, "syllabus": syllabus},
+            answer_workers=answer_workers,
+            answer_queue_size=answer_queue_size,
+            on_questions_done=cancel_syllabi,
+        )
 
     def _generate_subject(
         self,
@@ -82,77 +140,120 @@ class GeneralGenerator(BaseGenerator):
         encode_message = [
             {
                 "role": "system",
-                "content": prompt.generate_subject.format(
+                "content": prompt.generate_subject,
+            },
+            {
+                "role": "user",
+                "content": prompt.generate_subject_user.format(
                     discipline=discipline,
                     max_subjects=max_subjects,
                     max_subtopics=max_subtopics,
                 ),
             },
-            {
-                "role": "user",
-                "content": f"generate comprehensive list of subjects in {discipline} following the system prompt closely",
-            },
         ]
 
         res = make_llm_request(
             messages=encode_message,
             response_format=model.SubjectSchema,
+            stage="subject",
         )
 
         return res
 
+    async def _request_syllabus(self, subject: Dict, max_sessions: int) -> Dict:
+        encode_message = [
+            {
+                "role": "system",
+                "content": prompt.generate_syllabus,
+            },
+            {
+                "role": "user",
+                "content": prompt.generate_syllabus_user.format(
+                    subject=subject["subject"],
+                    level=subject["level"],
+                    subtopics=subject["subtopics"],
+                    max_sessions=max_sessions,
+                ),
+            },
+        ]
+
+        return await make_llm_request_async(
+            messages=encode_message,
+            response_format=model.SyllabusSchema,
+            stage="syllabus",
+        )
+
     def _generate_syllabus(
         self,
-        subjects: List,
+        subjects: Dict,
         max_sessions: int,
-    ) -> List:
-        """Generate syllabus for each subject"""
-        syllabus = []
-        for s in subjects["subjects"]:
-            subject = s["subject"]
-            level = s["level"]
-            subtopics = s["subtopics"]
-
-            encode_message = [
-                {
-                    "role": "system",
-                    "content": prompt.generate_syllabus.format(
-                        subject=subject,
-                        level=level,
-                        subtopics=subtopics,
-                        max_sessions=max_sessions,
-                    ),
-                },
-                {
-                    "role": "user",
-                    "content": "generate educational syllabus by following the system prompt closely",
-                },
-            ]
-
-            syllabi = make_llm_request(
-                messages=encode_message,
-                response_format=model.SyllabusSchema,
+        missing: Optional[List[int]] = None,
+    ) -> Dict[int, Future]:
+        """Request the syllabus of every subject concurrently without waiting.
+
+        Args:
+            subjects: Generated subjects
+            max_sessions: Maximum number of sessions per syllabus
+            missing: Positions of the subjects to request, all when not set
+
+        Returns:
+            Futures of the syllabi keyed by the position of their subject
+        """
+        if missing is None:
+            missing = range(len(subjects["subjects"]))
+        return {
+            i: submit_async(
+                self._request_syllabus(subjects["subjects"][i], max_sessions)
             )
-            syllabus.append(syllabi)
+            for i in missing
+        }
+
+    def _collect_syllabus(
+        self, pending: Dict[int, Future], syllabus: List[Optional[Dict]]
+    ) -> List[Dict]:
+        """Move finished syllabi from `pending` into `syllabus`.
+
+        Blocks only until the first syllabus arrives, so questions are generated
+        from the syllabi that are ready while the rest are still in flight.
+
+        Returns:
+            The syllabi available so far
+        """
+        if pending and not any(syl is not None for syl in syllabus):
+            wait(pending.values(), return_when=FIRST_COMPLETED)
+
+        for i, future in list(pending.items()):
+            if not future.done():
+                continue
+            del pending[i]
+            try:
+                syllabus[i] = future.result()
+            except Exception as e:
+                print(f"failed to generate syllabus for subject {i}: {e}")
 
-        return syllabus
+        available = [syl for syl in syllabus if syl is not None]
+        if not available:
+            if pending:
+                return self._collect_syllabus(pending, syllabus)
+            raise Exception("no syllabus could be generated")
+        return available
 
     def _build_question_prompt(self, **kwargs):
         """General question prompt"""
         return [
             {
                 "role": "system",
-                "content": prompt.generate_question.format(
+                "content": prompt.generate_question,
+            },
+            {
+                "role": "user",
+                "content": prompt.generate_question_user.format(
                     session=kwargs["session"],
                     concepts=kwargs["concepts"],
                     batch=kwargs["batch"],
                     max_tokens=kwargs["max_tokens"],
                 ),
             },
-            {
-                "role": "user",
-                "content": "generate homework questions based on the syllabus by following the system prompt closely",
-            },
         ]
 
     def _build_answer_prompt(self, **kwargs):
@@ -160,16 +261,16 @@ class GeneralGenerator(BaseGenerator):
         return [
             {
                 "role": "system",
-                "content": prompt.generate_answer.format(
+                "content": prompt.generate_answer,
+            },
+            {
+                "role": "user",
+                "content": prompt.generate_answer_user.format(
                     question=kwargs["question"],
                     input=kwargs["input"],
                     max_tokens=kwargs["max_tokens"],
                 ),
             },
-            {
-                "role": "user",
-                "content": "generate answer for a given question by following the system prompt closely",
-            },
         ]
 
     @property
@@ -1,8 +1,14 @@
-from typing import List
+import asyncio
+import itertools
+import json
+from typing import Dict, Iterable, Iterator, List, Optional
 
-from tqdm import tqdm
-
-from pyper.llm_api import make_llm_request
+from pyper.checkpoint import Checkpoint
+from pyper.chunking import estimate_tokens, iter_chunks
+from pyper.corpus import KnowledgeManifest, chunk_hash, resolve_knowledge_files
+from pyper.llm_api import make_llm_request_async, run_async
+from pyper.retrieval import PassageIndex
+from pyper.sink import JsonlSink
 
 from .. import model
 from ..prompt import knowledge_prompt as prompt
@@ -19,75 +25,350 @@ class KnowledgeGenerator(BaseGenerator):
         knowledge_path: str,
         num_sessions: int,
         num_questions: int,
+        execution: str = "online",
+        sink: Optional[JsonlSink] = None,
+        checkpoint: Optional[Checkpoint] = None,
+        dedup_backend: str = "numpy",
+        dedup_dtype: str = "float32",
+        embedding_cache: Optional[str] = None,
+        minhash_threshold: Optional[float] = 0.8,
+        minhash_num_perm: int = 128,
+        answer_workers: int = 64,
+        answer_queue_size: int = 256,
+        chunk_tokens: int = 8000,
+        syllabus_concurrency: int = 8,
+        knowledge_manifest: Optional[str] = None,
+        retrieval_top_k: int = 3,
+        passage_tokens: int = 256,
     ):
         """Generate tasks and answers based on provided knowledge content.
 
         Args:
             num_tasks (int): Total number of tasks to generate
-            knowledge_path (str): Path to the knowledge content file
+            knowledge_path (str): Knowledge file, directory or glob pattern
             num_sessions (int): Number of sessions to generate in the syllabus
             num_questions (int): Number of questions to generate per batch
+            execution (str): `online` for concurrent requests or `batch` to
+                generate answers through the Batch API
+            sink (JsonlSink, optional): Sink that finished records are streamed to
+            checkpoint (Checkpoint, optional): Checkpoint the question loop is
+                periodically saved to and resumed from when it holds a state
+            dedup_backend (str): Index used for deduplication, `numpy` or `chroma`
+            dedup_dtype (str): Storage type of the numpy index rows
+            embedding_cache (str, optional): Path prefix of the persistent cache
+                for question embeddings
+            minhash_threshold (float, optional): Jaccard similarity above which
+                the MinHash prefilter drops a question, disabled when not set
+            minhash_num_perm (int): Number of MinHash permutations
+            answer_workers (int): Answers requested concurrently while questions
+                are still being generated
+            answer_queue_size (int): Accepted questions waiting for an answer
+                before question generation blocks
+            chunk_tokens (int): Estimated tokens of knowledge per syllabus request,
+                larger files are split and their partial syllabi merged
+            syllabus_concurrency (int): Syllabus requests in flight at once
+            knowledge_manifest (str, optional): Manifest of the knowledge already
+                processed. When set only new or changed chunks are turned into
+                a syllabus and questions, deduplicated against earlier runs
+            retrieval_top_k (int): Passages of the knowledge retrieved for each
+                answer, 0 answers without them
+            passage_tokens (int): Estimated tokens of a retrieved passage
 
         Returns:
             tuple: A tuple containing (clean_tasks, answers) where:
                 - clean_tasks: List of deduplicated question tasks
                 - answers: List of corresponding answers for each task
         """
-        print("generating syllabus...")
-        syllabus = self._generate_syllabus(
-            knowledge_path=knowledge_path,
-            max_sessions=num_sessions,
+        self._init_index(
+            dedup_backend,
+            dedup_dtype,
+            embedding_cache,
+            minhash_threshold,
+            minhash_num_perm,
         )
-        clean_tasks = []
-        with tqdm(total=num_tasks) as pbar:
-            while len(clean_tasks) < num_tasks - 1:
-                print("generating questions...")
-                try:
-                    q_res = self._generate_question_task(
-                        syllabus=syllabus,
-                        batch=num_questions,
-                        knowledge=True,
-                    )
-                except Exception:
-                    raise
+        manifest = KnowledgeManifest(knowledge_manifest) if knowledge_manifest else None
+        state = checkpoint.state if checkpoint is not None else None
+        if state:
+            self._restore_checkpoint(state)
+            syllabus = state["syllabus"]
+            clean_tasks = state["clean_tasks"]
+            if manifest is not None and state.get("manifest") is not None:
+                # the syllabus step that records the corpus is not run again
+                manifest.restore_pending(state["manifest"])
+                manifest.prune(resolve_knowledge_files(knowledge_path))
+        else:
+            print("generating syllabus...")
+            syllabus = self._generate_syllabus(
+                knowledge_path=knowledge_path,
+                max_sessions=num_sessions,
+                chunk_tokens=chunk_tokens,
+                concurrency=syllabus_concurrency,
+                manifest=manifest,
+            )
+            if syllabus is None:
+                print("no new or changed knowledge, nothing to generate")
+                # keeps the file stats current so unchanged files are not read again
+                manifest.save()
+                return []
+            clean_tasks = []
+            if manifest is not None:
+                self._seed_index(manifest.questions)
 
-                clean_t = self._deduplicate_task(q_res)
-                clean_tasks.extend(clean_t)
-                pbar.update(len(clean_t))
+        if retrieval_top_k > 0:
+            print("indexing knowledge passages...")
+            self._init_passages(
+                knowledge_path,
+                retrieval_top_k,
+                passage_tokens,
+                dedup_dtype,
+                f"{knowledge_manifest}.passages" if knowledge_manifest else None,
+            )
 
-        print("generating answers...")
-        answers = self._generate_answers(question_tasks=clean_tasks)
+        def generate_questions(deficit: int) -> List:
+            return self._generate_question_task(
+                syllabus=syllabus,
+                batch=num_questions,
+                deficit=deficit,
+                knowledge=True,
+            )
 
-        return self._build_dataset(clean_tasks, answers)
+        def record_questions(clean_tasks: List):
+            if manifest is not None:
+                # chunks only count as processed once their questions exist
+                manifest.record_questions(clean_tasks)
+                manifest.save()
 
-    def _generate_syllabus(self, knowledge_path: str, max_sessions: int = 3) -> List:
-        """Generate a syllabus based on provided knowledge content.
+        return self._run_question_loop(
+            generate_questions,
+            clean_tasks,
+            num_tasks,
+            execution,
+            sink,
+            checkpoint,
+            state={
+                "syllabus": syllabus,
+                "manifest": manifest.pending() if manifest is not None else None,
+            },
+            answer_workers=answer_workers,
+            answer_queue_size=answer_queue_size,
+            on_questions_done=record_questions,
+        )
 
-        Args:
-            knowledge_path (str): Path to the knowledge content file
-            max_sessions (int, optional): Maximum number of sessions to generate. Defaults to 3.
+    def _init_passages(
+        self,
+        knowledge_path: str,
+        top_k: int,
+        passage_tokens: int,
+        dtype: str,
+        cache_path: Optional[str] = None,
+    ):
+        """Index the whole corpus so answers can be grounded in its passages.
 
-        Returns:
-            List: Generated syllabus structure based on the knowledge content
+        Passages and queries stay out of the question embedding cache, passage
+        embeddings are cached at `cache_path` next to the manifest instead.
         """
+        embedding_fn = getattr(self.embedding_fn, "embedding_fn", self.embedding_fn)
+        self.passages = PassageIndex(
+            embedding_fn,
+            dtype=dtype,
+            passage_tokens=passage_tokens,
+            cache_path=cache_path,
+        )
+        self.passages.build(resolve_knowledge_files(knowledge_path))
+        self.retrieval_top_k = top_k
+
+    async def _request_syllabus(self, knowledge: str, max_sessions: int) -> Dict:
         encode_message = [
             {
                 "role": "system",
-                "content": prompt.generate_syllabus.format(
-                    knowledge=open(knowledge_path).read(), max_sessions=max_sessions
-                ),
+                "content": prompt.generate_syllabus,
             },
             {
                 "role": "user",
-                "content": "generate educational syllabus by following the system prompt closely",
+                "content": prompt.generate_syllabus_user.format(
+                    knowledge=knowledge, max_sessions=max_sessions
+                ),
             },
         ]
+        return await make_llm_request_async(
+            messages=encode_message,
+            response_format=model.SyllabusSchema,
+            stage="syllabus",
+        )
 
-        syllabus = make_llm_request(
+    async def _merge_syllabi(self, syllabi: List[Dict], max_sessions: int) -> Dict:
+        encode_message = [
+            {
+                "role": "system",
+                "content": prompt.merge_syllabus,
+            },
+            {
+                "role": "user",
+                "content": prompt.merge_syllabus_user.format(
+                    syllabi=json.dumps(syllabi, indent=1), max_sessions=max_sessions
+                ),
+            },
+        ]
+        return await make_llm_request_async(
             messages=encode_message,
             response_format=model.SyllabusSchema,
+            stage="syllabus_merge",
+        )
+
+    async def _request_partial(
+        self,
+        chunk: str,
+        key: str,
+        max_sessions: int,
+        manifest: Optional[KnowledgeManifest],
+    ) -> Dict:
+        syllabus = await self._request_syllabus(chunk, max_sessions)
+        if manifest is not None:
+            manifest.record_chunk(key, syllabus)
+        return syllabus
+
+    def _syllabus_jobs(
+        self,
+        files: List[str],
+        max_sessions: int,
+        chunk_tokens: int,
+        manifest: Optional[KnowledgeManifest],
+    ) -> Iterator:
+        """Yield a partial syllabus request for every chunk not processed yet."""
+        seen = set()
+        for path in files:
+            if manifest is not None and manifest.unchanged_chunks(path) is not None:
+                continue
+            keys = []
+            for chunk in iter_chunks(path, chunk_tokens):
+                key = chunk_hash(chunk, salt=str(max_sessions))
+                keys.append(key)
+                if key in seen or (manifest is not None and key in manifest.chunks):
+                    continue
+                seen.add(key)
+                yield self._request_partial(chunk, key, max_sessions, manifest)
+            if manifest is not None:
+                manifest.record_file(path, keys)
+
+    async def _gather_bounded(self, jobs: Iterable, concurrency: int) -> List:
+        """Await coroutines from `jobs` with at most `concurrency` in flight.
+
+        `jobs` is consumed lazily, so a generator only creates the next request
+        once a slot is free. Failed jobs are logged and left out.
+        """
+        slots = asyncio.Semaphore(concurrency)
+
+        async def run(job):
+            try:
+                return await job
+            finally:
+                slots.release()
+
+        tasks = []
+        for job in jobs:
+            await slots.acquire()
+            tasks.append(asyncio.create_task(run(job)))
+
+        results = []
+        for i, res in enumerate(await asyncio.gather(*tasks, return_exceptions=True)):
+            if isinstance(res, Exception):
+                print(f"failed to generate partial syllabus {i}: {res}")
+            else:
+                results.append(res)
+        return results
+
+    def _group_syllabi(self, syllabi: List[Dict], max_tokens: int) -> List[List[Dict]]:
+        """Pack syllabi into groups that fit one merge request."""
+        groups, group, size = [], [], 0
+        for syl in syllabi:
+            tokens = estimate_tokens(json.dumps(syl, indent=1))
+            # a group always takes two syllabi so every round shrinks the list
+            if len(group) >= 2 and size + tokens > max_tokens:
+                groups.append(group)
+                group, size = [], 0
+            group.append(syl)
+            size += tokens
+        if group:
+            groups.append(group)
+        return groups
+
+    async def _generate_syllabus_async(
+        self,
+        files: List[str],
+        max_sessions: int,
+        chunk_tokens: int,
+        concurrency: int,
+        manifest: Optional[KnowledgeManifest] = None,
+    ) -> Optional[Dict]:
+        jobs = self._syllabus_jobs(files, max_sessions, chunk_tokens, manifest)
+        # peek so a corpus without new content is not mistaken for a failure
+        first = next(jobs, None)
+        if first is None and manifest is not None:
+            return None
+        partials = await self._gather_bounded(
+            itertools.chain([first] if first else [], jobs), concurrency
         )
+        if not partials:
+            raise Exception("no syllabus could be generated from the knowledge")
+
+        # merge hierarchically until a single syllabus is left
+        if len(partials) > 1:
+            print(f"generated {len(partials)} partial syllabi")
+        while len(partials) > 1:
+            groups = self._group_syllabi(partials, chunk_tokens)
+            merged = await self._gather_bounded(
+                (
+                    (
+                        self._merge_syllabi(group, max_sessions)
+                        if len(group) > 1
+                        # a group of one passes through unchanged
+                        else asyncio.sleep(0, group[0])
+                    )
+                    for group in groups
+                ),
+                concurrency,
+            )
+            if len(merged) < len(groups):
+                raise Exception("failed to merge partial syllabi")
+            print(f"merged {len(partials)} partial syllabi into {len(merged)}")
+            partials = merged
+        return partials[0]
+
+    def _generate_syllabus(
+        self,
+        knowledge_path: str,
+        max_sessions: int = 3,
+        chunk_tokens: int = 8000,
+        concurrency: int = 8,
+        manifest: Optional[KnowledgeManifest] = None,
+    ) -> Optional[Dict]:
+        """Generate a syllabus based on provided knowledge content.
+
+        The files are streamed in chunks of `chunk_tokens`, a partial syllabus
+        is requested for every chunk and the partial syllabi are merged in
+        rounds of merge requests until one is left. A file that fits one chunk
+        takes a single request. With a manifest, chunks it already holds are
+        skipped so the syllabus only covers new or changed content.
+
+        Args:
+            knowledge_path (str): Knowledge file, directory or glob pattern
+            max_sessions (int, optional): Maximum number of sessions to generate. Defaults to 3.
+            chunk_tokens (int): Estimated tokens of knowledge per request
+            concurrency (int): Syllabus requests in flight at once
+            manifest (KnowledgeManifest, optional): Knowledge processed in earlier runs
 
+        Returns:
+            Dict: Generated syllabus structure based on the knowledge content,
+                None when the manifest already covers all of it
+        """
+        files = resolve_knowledge_files(knowledge_path)
+        syllabus = run_async(
+            self._generate_syllabus_async(
+                files, max_sessions, chunk_tokens, concurrency, manifest
+            )
+        )
+        if manifest is not None:
+            manifest.prune(files)
         return syllabus
 
     def _build_question_prompt(self, **kwargs):
@@ -95,17 +376,17 @@ class KnowledgeGenerator(BaseGenerator):
         return [
             {
                 "role": "system",
-                "content": prompt.generate_question.format(
+                "content": prompt.generate_question,
+            },
+            {
+                "role": "user",
+                "content": prompt.generate_question_user.format(
                     session=kwargs["session"],
                     concepts=kwargs["concepts"],
                     batch=kwargs["batch"],
                     max_tokens=kwargs["max_tokens"],
                 ),
             },
-            {
-                "role": "user",
-                "content": "generate questions by following the system prompt closely",
-            },
         ]
 
     def _build_answer_prompt(self, **kwargs):
@@ -113,18 +394,26 @@ class KnowledgeGenerator(BaseGenerator):
         return [
             {
                 "role": "system",
-                "content": prompt.generate_answer.format(
+                "content": prompt.generate_answer,
+            },
+            {
+                "role": "user",
+                "content": prompt.generate_answer_user.format(
                     question=kwargs["question"],
                     input=kwargs["input"],
                     max_tokens=kwargs["max_tokens"],
+                    passages=self._format_passages(kwargs.get("passages")),
                 ),
             },
-            {
-                "role": "user",
-                "content": "generate answer for a given question by following the system prompt closely",
-            },
         ]
 
+    def _format_passages(self, passages: Optional[List[str]]) -> str:
+        if not passages:
+            return ""
+        return prompt.answer_passages.format(
+            passages="\n\n".join(f"[{i}] {p}" for i, p in enumerate(passages, 1))
+        )
+
     @property
     def question_schema(self):
         return model.QuestionSchema
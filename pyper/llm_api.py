@@ -1,55 +1,798 @@
+import asyncio
+import concurrent.futures
+import functools
 import json
 import os
-from datetime import datetime
-from typing import List
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, fields
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Coroutine,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+)
 
-from openai import OpenAI
-from openai.lib._pydantic import to_strict_json_schema
+from pyper.cache import ResponseCache
+from pyper.metrics import get_metrics
 
+# openai and httpx take a large share of the CLI startup time, they are
+# imported when the first client is created
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
 
-def make_llm_request(
+    from pyper.batch import BatchExecutor
+
+DEFAULT_MODEL = "gpt-4o"
+MAX_TOKENS = 15000
+
+# process-wide client settings, see `configure_client`
+_client_config = {
+    "max_connections": 200,
+    "max_keepalive_connections": 50,
+    "keepalive_expiry": 30.0,
+    "timeout": 120.0,
+}
+# limits of endpoints that do not set their own, see `configure_scheduler`
+_scheduler_config: Dict[str, Any] = {}
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+_endpoints: Optional[List["Endpoint"]] = None
+_pool: Optional["EndpointPool"] = None
+_pool_lock = threading.Lock()
+
+_cache: Optional[ResponseCache] = None
+
+
+def configure_client(
+    max_connections: int = None,
+    max_keepalive_connections: int = None,
+    keepalive_expiry: float = None,
+    timeout: float = None,
+):
+    """Configure the pooled async clients used by every LLM request.
+
+    Has to be called before the first request is made, the clients are
+    created lazily and reused for the rest of the process.
+
+    Args:
+        max_connections: Maximum number of concurrent connections per endpoint
+        max_keepalive_connections: Number of idle connections kept alive
+        keepalive_expiry: Seconds an idle connection is kept open
+        timeout: Default per-request timeout in seconds
+    """
+    global _pool
+    updates = {
+        "max_connections": max_connections,
+        "max_keepalive_connections": max_keepalive_connections,
+        "keepalive_expiry": keepalive_expiry,
+        "timeout": timeout,
+    }
+    with _pool_lock:
+        _client_config.update({k: v for k, v in updates.items() if v is not None})
+        # drop the old pool so the next request picks up the new settings
+        _pool = None
+
+
+def _make_client(base_url: Optional[str], api_key: Optional[str]) -> "AsyncOpenAI":
+    import httpx
+    from openai import AsyncOpenAI
+
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=_client_config["max_connections"],
+            max_keepalive_connections=_client_config["max_keepalive_connections"],
+            keepalive_expiry=_client_config["keepalive_expiry"],
+        ),
+        # waiting for a free connection is bounded by the pool size, not by the
+        # request timeout
+        timeout=httpx.Timeout(_client_config["timeout"], pool=None),
+    )
+    return AsyncOpenAI(
+        base_url=base_url,
+        api_key=api_key,
+        http_client=http_client,
+        timeout=_client_config["timeout"],
+        max_retries=0,
+    )
+
+
+def get_async_client() -> "AsyncOpenAI":
+    """Return the async client of the first endpoint of the pool."""
+    return get_endpoint_pool().members[0].client
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """Return the background event loop all LLM requests run on.
+
+    Pooled connections are bound to the loop that opened them, so every request
+    in the process is executed on one long-lived loop in a daemon thread.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="pyper-llm-loop", daemon=True
+            ).start()
+        return _loop
+
+
+def run_async(coro: Coroutine) -> Any:
+    """Run a coroutine on the shared event loop and block until it finishes.
+
+    Must not be called from a coroutine already running on the shared loop.
+    """
+    loop = _get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        raise RuntimeError("run_async cannot be called from the shared event loop")
+
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+def submit_async(coro: Coroutine) -> concurrent.futures.Future:
+    """Schedule a coroutine on the shared event loop without waiting for it."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop())
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute` units per minute."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float):
+        # a single request larger than the bucket only waits for a full bucket
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def refund(self, amount: float):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def sync(self, remaining: float):
+        """Align the local estimate with the remaining quota reported by the server."""
+        self._refill()
+        self.tokens = min(self.tokens, remaining)
+
+
+def _parse_reset(value: str) -> Optional[float]:
+    """Parse reset durations like `1s`, `6m0s` or `20ms` into seconds."""
+    if not value:
+        return None
+    total = 0.0
+    for num, unit in re.findall(r"([\d.]+)(ms|s|m|h)", value):
+        total += float(num) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return total
+
+
+def _retryable_errors() -> tuple:
+    """Errors the scheduler retries with backoff."""
+    import openai
+
+    return (
+        openai.RateLimitError,
+        openai.InternalServerError,
+        openai.APIConnectionError,
+        openai.APITimeoutError,
+    )
+
+
+def _overload_errors() -> tuple:
+    """Errors that make the scheduler lower its concurrency limit."""
+    import openai
+
+    return (openai.RateLimitError, openai.InternalServerError)
+
+
+def _rejected_key_errors() -> tuple:
+    """Errors that take an endpoint out of the pool right away."""
+    import openai
+
+    return (openai.AuthenticationError, openai.PermissionDeniedError)
+
+
+def is_rejected_key_error(error: BaseException) -> bool:
+    """Whether `error`, or the error it was raised from, rejected the API key."""
+    while error is not None:
+        if isinstance(error, _rejected_key_errors()):
+            return True
+        error = error.__cause__
+    return False
+
+
+def _strict_schema(response_format) -> Dict[str, Any]:
+    from openai.lib._pydantic import to_strict_json_schema
+
+    return to_strict_json_schema(response_format)
+
+
+class RequestScheduler:
+    """Scheduler every LLM request to one endpoint goes through.
+
+    Enforces requests-per-minute and tokens-per-minute budgets with token
+    buckets, keeps the buckets in line with the `x-ratelimit-*` response
+    headers and adapts the number of in-flight requests AIMD-style: the limit
+    grows by one per window of successful requests and is halved on 429/5xx.
+    Retryable failures are retried with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        rpm: Optional[int] = None,
+        tpm: Optional[int] = None,
+        max_concurrency: int = 64,
+        min_concurrency: int = 1,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        self.request_bucket = TokenBucket(rpm) if rpm else None
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max(min_concurrency, min(8, max_concurrency)))
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    async def _acquire_slot(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def _release_slot(self):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def _on_success(self):
+        self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+    def _on_overload(self):
+        # one burst of failures should only halve the limit once
+        now = time.monotonic()
+        if now - self.last_decrease > 1.0:
+            self.limit = max(self.min_concurrency, self.limit / 2)
+            self.last_decrease = now
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        """Sync local buckets with the rate-limit headers of a response."""
+        if headers is None:
+            return
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        if self.request_bucket and remaining_requests is not None:
+            self.request_bucket.sync(float(remaining_requests))
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if self.token_bucket and remaining_tokens is not None:
+            self.token_bucket.sync(float(remaining_tokens))
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        response = getattr(error, "response", None)
+        headers = response.headers if response is not None else {}
+        retry_after = headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        reset = _parse_reset(headers.get("x-ratelimit-reset-requests")) or _parse_reset(
+            headers.get("x-ratelimit-reset-tokens")
+        )
+        if reset:
+            return reset + random.uniform(0, self.base_delay)
+
+        delay = min(self.max_delay, self.base_delay * 2**attempt)
+        return delay * random.uniform(0.5, 1.5)
+
+    async def submit(
+        self,
+        request: Callable[[], Awaitable[Any]],
+        estimated_tokens: int = 0,
+        max_retries: Optional[int] = None,
+    ) -> Any:
+        """Run `request` under the rate limits, retrying retryable failures.
+
+        Args:
+            request: Zero-argument coroutine function issuing one API call.
+                Must return a `(result, headers, total_tokens)` tuple
+            estimated_tokens: Token cost reserved from the TPM budget up front
+            max_retries: Overrides the retries of the scheduler for this request
+
+        Returns:
+            The result returned by `request`
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            if self.request_bucket:
+                await self.request_bucket.acquire(1)
+            if self.token_bucket:
+                await self.token_bucket.acquire(estimated_tokens)
+
+            await self._acquire_slot()
+            try:
+                result, headers, used_tokens = await request()
+            except _retryable_errors() as e:
+                if isinstance(e, _overload_errors()):
+                    self._on_overload()
+                    self.update_from_headers(e.response.headers)
+                if attempt >= max_retries:
+                    raise
+                delay = self._retry_delay(attempt, e)
+                attempt += 1
+                print(
+                    f"retrying request in {delay:.1f}s ({attempt}/{max_retries}): {e}"
+                )
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                await self._release_slot()
+
+            self._on_success()
+            self.update_from_headers(headers)
+            if self.token_bucket and used_tokens is not None:
+                self.token_bucket.refund(max(0, estimated_tokens - used_tokens))
+            return result
+
+
+def configure_scheduler(
+    rpm: int = None,
+    tpm: int = None,
+    max_concurrency: int = None,
+    max_retries: int = None,
+):
+    """Configure the request schedulers of the endpoint pool.
+
+    Endpoints that set their own `rpm`, `tpm` or `max_concurrency` keep them,
+    the others use these values.
+
+    Args:
+        rpm: Requests-per-minute budget, unlimited if not set
+        tpm: Tokens-per-minute budget, unlimited if not set
+        max_concurrency: Upper bound for the adaptive number of in-flight requests
+        max_retries: Retries for rate-limited or failed requests
+    """
+    global _pool
+    kwargs = {
+        "rpm": rpm,
+        "tpm": tpm,
+        "max_concurrency": max_concurrency,
+        "max_retries": max_retries,
+    }
+    with _pool_lock:
+        _scheduler_config.clear()
+        _scheduler_config.update({k: v for k, v in kwargs.items() if v is not None})
+        _pool = None
+
+
+def get_scheduler() -> RequestScheduler:
+    """Return the request scheduler of the first endpoint of the pool."""
+    return get_endpoint_pool().members[0].scheduler
+
+
+@dataclass
+class Endpoint:
+    """An OpenAI-compatible endpoint requests can be sent to.
+
+    `base_url` and `api_key` fall back to `OPENAI_BASE_URL` and
+    `OPENAI_API_KEY` when not set, `api_key_env` reads the key from another
+    environment variable so endpoint files do not have to contain secrets.
+    Limits that are not set fall back to the values of `configure_scheduler`.
+    """
+
+    base_url: Optional[str] = None
+    api_key: Optional[str] = None
+    api_key_env: Optional[str] = None
+    model: str = DEFAULT_MODEL
+    weight: float = 1.0
+    rpm: Optional[int] = None
+    tpm: Optional[int] = None
+    max_concurrency: Optional[int] = None
+    name: Optional[str] = None
+
+    def __post_init__(self):
+        if self.weight <= 0:
+            raise ValueError(f"Endpoint weight must be positive, got {self.weight}")
+
+    @property
+    def label(self) -> str:
+        return self.name or self.base_url or "default"
+
+    def resolve_key(self) -> Optional[str]:
+        if self.api_key_env:
+            key = os.environ.get(self.api_key_env)
+            if not key:
+                raise ValueError(
+                    f"Environment variable {self.api_key_env} of endpoint "
+                    f"{self.label} is not set"
+                )
+            return key
+        return self.api_key
+
+
+def load_endpoints(path: str) -> List[Endpoint]:
+    """Load endpoints from a JSON file holding a list of endpoint objects.
+
+    Args:
+        path: JSON file, either a list or an object with an `endpoints` list
+
+    Returns:
+        The endpoints in file order
+    """
+    with open(path) as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("endpoints", [])
+    if not data:
+        raise ValueError(f"No endpoints defined in {path}")
+
+    known = {f.name for f in fields(Endpoint)}
+    endpoints = []
+    for entry in data:
+        unknown = set(entry) - known
+        if unknown:
+            raise ValueError(f"Unknown endpoint options: {', '.join(sorted(unknown))}")
+        endpoints.append(Endpoint(**entry))
+    return endpoints
+
+
+class PoolMember:
+    """Client, scheduler and health of one endpoint of the pool."""
+
+    def __init__(self, endpoint: Endpoint):
+        self.endpoint = endpoint
+        self.client = _make_client(endpoint.base_url, endpoint.resolve_key())
+        limits = {
+            "rpm": endpoint.rpm,
+            "tpm": endpoint.tpm,
+            "max_concurrency": endpoint.max_concurrency,
+        }
+        self.scheduler = RequestScheduler(
+            **{
+                **_scheduler_config,
+                **{k: v for k, v in limits.items() if v is not None},
+            }
+        )
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.unhealthy_until
+
+
+class EndpointPool:
+    """Distributes requests over several endpoints.
+
+    Each request goes to the healthy endpoint with the fewest outstanding
+    requests relative to its weight. Every endpoint has its own client and
+    scheduler, so rate limits and the adaptive concurrency are tracked per
+    key. An endpoint that fails `failure_threshold` requests in a row is
+    skipped for a cooldown that doubles while it keeps failing, a rejected key
+    is skipped for `max_cooldown` right away. A request that fails on one
+    endpoint is retried on the next one instead of on the same endpoint.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        max_cooldown: float = 300.0,
+    ):
+        """
+        Args:
+            endpoints: Endpoints of the pool, at least one
+            failure_threshold: Consecutive failures before an endpoint is skipped
+            cooldown: Seconds an endpoint is skipped after reaching the threshold
+            max_cooldown: Upper bound of the doubling cooldown
+        """
+        if not endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint")
+        self.members = [PoolMember(endpoint) for endpoint in endpoints]
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_retries = self.members[0].scheduler.max_retries
+
+    @property
+    def model_key(self) -> str:
+        """Models of the pool, part of the response cache key."""
+        return ",".join(sorted({m.endpoint.model for m in self.members}))
+
+    def _pick(self, tried) -> PoolMember:
+        now = time.monotonic()
+        healthy = [m for m in self.members if m.healthy(now)]
+        if not healthy:
+            # every endpoint is cooling down, use the one that recovers first
+            return min(self.members, key=lambda m: m.unhealthy_until)
+        candidates = [m for m in healthy if m not in tried] or healthy
+        return min(
+            candidates,
+            key=lambda m: ((m.outstanding + 1) / m.endpoint.weight, random.random()),
+        )
+
+    def _record_failure(self, member: PoolMember, error: Exception):
+        member.failures += 1
+        member.consecutive_failures += 1
+        if isinstance(error, _rejected_key_errors()):
+            cooldown = self.max_cooldown
+        elif member.consecutive_failures >= self.failure_threshold:
+            excess = member.consecutive_failures - self.failure_threshold
+            cooldown = min(self.max_cooldown, self.cooldown * 2**excess)
+        else:
+            return
+        now = time.monotonic()
+        if not member.healthy(now):
+            # requests that were in flight when it was marked keep failing
+            return
+        member.unhealthy_until = now + cooldown
+        print(
+            f"endpoint {member.endpoint.label} unhealthy for {cooldown:.0f}s: {error}"
+        )
+
+    def _record_success(self, member: PoolMember):
+        member.consecutive_failures = 0
+        member.unhealthy_until = 0.0
+
+    async def submit(
+        self,
+        request: Callable[[PoolMember], Awaitable[Any]],
+        estimated_tokens: int = 0,
+    ) -> Any:
+        """Run `request` on an endpoint of the pool, failing over on errors.
+
+        Args:
+            request: Coroutine function issuing one API call with the client
+                and model of the given member. Must return a
+                `(result, headers, total_tokens)` tuple
+            estimated_tokens: Token cost reserved from the TPM budget up front
+
+        Returns:
+            The result returned by `request`
+        """
+        single = len(self.members) == 1
+        tried = set()
+        failovers = 0
+        while True:
+            member = self._pick(tried)
+            member.outstanding += 1
+            member.requests += 1
+            try:
+                # a single endpoint retries itself, a pool moves on to the next
+                # endpoint instead
+                result = await member.scheduler.submit(
+                    functools.partial(request, member),
+                    estimated_tokens,
+                    max_retries=None if single else 0,
+                )
+            except _retryable_errors() + _rejected_key_errors() as e:
+                self._record_failure(member, e)
+                if single or failovers >= self.max_retries:
+                    raise
+                failovers += 1
+                tried.add(member)
+                print(f"failing over from endpoint {member.endpoint.label}: {e}")
+                if len(tried) == len(self.members):
+                    # the request failed on every endpoint, back off before the
+                    # next round
+                    tried.clear()
+                    await asyncio.sleep(member.scheduler._retry_delay(failovers, e))
+                continue
+            finally:
+                member.outstanding -= 1
+            self._record_success(member)
+            return result
+
+    def report(self):
+        """Print the requests and failures of every endpoint."""
+        for member in self.members:
+            print(
+                f"endpoint {member.endpoint.label} ({member.endpoint.model}): "
+                f"{member.requests} requests, {member.failures} failed"
+            )
+
+
+def configure_endpoints(endpoints: Optional[List[Endpoint]]):
+    """Set the endpoints requests are distributed over.
+
+    Args:
+        endpoints: Endpoints of the pool, None for the default endpoint from
+            the `OPENAI_*` environment variables
+    """
+    global _endpoints, _pool
+    with _pool_lock:
+        _endpoints = endpoints
+        _pool = None
+
+
+def get_endpoint_pool() -> EndpointPool:
+    """Return the process-wide endpoint pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = EndpointPool(_endpoints or [Endpoint()])
+        return _pool
+
+
+def configure_cache(
+    cache_dir: Optional[str],
+    max_bytes: int = None,
+    ttl: float = None,
+):
+    """Enable the on-disk response cache, or disable it when `cache_dir` is None.
+
+    Args:
+        cache_dir: Directory holding the cache database
+        max_bytes: Size bound of the cache before LRU eviction kicks in
+        ttl: Seconds after which a cached response is considered stale
+    """
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+    if cache_dir:
+        kwargs = {"max_bytes": max_bytes, "ttl": ttl}
+        _cache = ResponseCache(
+            cache_dir, **{k: v for k, v in kwargs.items() if v is not None}
+        )
+
+
+def get_cache() -> Optional[ResponseCache]:
+    return _cache
+
+
+def _estimate_tokens(messages: List, max_tokens: int) -> int:
+    # rough estimate of ~4 characters per token, corrected with the actual usage
+    # once the response arrives
+    return sum(len(str(m.get("content", ""))) for m in messages) // 4 + max_tokens
+
+
+async def make_llm_request_async(
     messages,
     response_format,
+    stage: str = "default",
     **kwargs,
 ):
-    client = OpenAI()
-    try:
-        res = client.beta.chat.completions.parse(
-            model="gpt-4o",
+    """Request a structured response through the shared scheduler and cache.
+
+    `stage` names the pipeline stage the request is made for, its tokens,
+    latency and retries are recorded under that name in the metrics registry.
+    """
+    pool = get_endpoint_pool()
+    max_tokens = kwargs.pop("max_tokens", MAX_TOKENS)
+    metrics = get_metrics()
+
+    cache = get_cache()
+    if cache is not None:
+        params = {k: v for k, v in kwargs.items() if k != "timeout"}
+        key = cache.make_key(
+            model=pool.model_key,
+            messages=messages,
+            schema=_strict_schema(response_format),
+            params={"max_tokens": max_tokens, **params},
+        )
+        # SQLite I/O would stall every request sharing the event loop
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            metrics.record_cache_hit(stage)
+            return cached
+
+    attempts = 0
+
+    async def request(member: PoolMember):
+        nonlocal attempts
+        attempts += 1
+        raw = await member.client.beta.chat.completions.with_raw_response.parse(
+            model=member.endpoint.model,
             messages=messages,
             response_format=response_format,
-            max_tokens=15000,
+            max_tokens=max_tokens,
             **kwargs,
         )
+        res = raw.parse()
+        used = res.usage.total_tokens if res.usage else None
+        return res, raw.headers, used
 
-        return json.loads(res.choices[0].message.content)
+    started = time.monotonic()
+    try:
+        res = await pool.submit(
+            request, estimated_tokens=_estimate_tokens(messages, max_tokens)
+        )
+        content = json.loads(res.choices[0].message.content)
     except Exception as e:
-        raise Exception(f"error generating response from model: {str(e)}")
+        metrics.record_request(
+            stage,
+            time.monotonic() - started,
+            retries=max(attempts - 1, 0),
+            failed=True,
+        )
+        raise Exception(f"error generating response from model: {str(e)}") from e
+    metrics.record_request(
+        stage,
+        time.monotonic() - started,
+        usage=res.usage,
+        retries=attempts - 1,
+    )
 
+    if cache is not None:
+        await asyncio.to_thread(cache.put, key, content)
+    return content
 
-def make_llm_batch_request(
-    tasks: List,
+
+def make_llm_request(
+    messages,
     response_format,
+    **kwargs,
 ):
-    try:
-        client = OpenAI()
+    return run_async(make_llm_request_async(messages, response_format, **kwargs))
+
+
+def make_llm_batch_request(
+    messages_list: List[List[Dict]],
+    response_format,
+    executor: Optional["BatchExecutor"] = None,
+    stage: str = "default",
+    **kwargs,
+) -> List[Optional[Dict]]:
+    """Run requests through the Batch API and wait for their results.
 
-        data_dir = "./batch"
-        os.makedirs(data_dir, exist_ok=True)
+    Args:
+        messages_list: Messages of each request
+        response_format: Pydantic model describing the structured output
+        executor: BatchExecutor to use, by default one for the first endpoint
+            of the pool
+        stage: Pipeline stage the token usage is recorded under
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{data_dir}/batch_tasks_{timestamp}.jsonl"
-        with open(filename, "w") as f:
-            for t in tasks:
-                f.write(json.dumps(t) + "\n")
+    Returns:
+        Parsed responses in request order, None for requests that failed
+    """
+    if executor is None:
+        from openai import OpenAI
 
-        batch_file = client.files.create(file=open(filename, "rb"), purpose="batch")
+        from pyper.batch import BatchExecutor
 
-        batch_job = client.batches.create(
-            input_file_id=batch_file.id,
-            endpoint="/v1/chat/completions",
-            completion_window="24h",
+        # the Batch API is not load balanced, self-hosted servers rarely offer it
+        endpoint = get_endpoint_pool().members[0].endpoint
+        executor = BatchExecutor(
+            client=OpenAI(base_url=endpoint.base_url, api_key=endpoint.resolve_key()),
+            model=endpoint.model,
+            max_tokens=MAX_TOKENS,
         )
-        return batch_job
+    try:
+        return executor.run(messages_list, response_format, stage=stage, **kwargs)
     except Exception as e:
         raise Exception(f"Error processing batch request: {str(e)}")
@@ -0,0 +1,253 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+_registry: Optional["MetricsRegistry"] = None
+_registry_lock = threading.Lock()
+
+
+class StageMetrics:
+    """Counters of a single pipeline stage such as `question` or `breadth`."""
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.latencies: List[float] = []
+        self.candidates = 0
+        self.accepted = 0
+
+    def summary(self) -> Dict[str, Any]:
+        tokens = self.prompt_tokens + self.completion_tokens
+        latency = {}
+        if self.latencies:
+            import numpy as np
+
+            p50, p90, p99 = np.percentile(self.latencies, [50, 90, 99])
+            latency = {
+                "p50": round(float(p50), 4),
+                "p90": round(float(p90), 4),
+                "p99": round(float(p99), 4),
+                "max": round(max(self.latencies), 4),
+            }
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "retries": self.retries,
+            "cache_hits": self.cache_hits,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cached_prompt_ratio": (
+                self.cached_tokens / self.prompt_tokens if self.prompt_tokens else None
+            ),
+            "latency_seconds": latency,
+            "candidates": self.candidates,
+            "accepted": self.accepted,
+            "acceptance_rate": (
+                self.accepted / self.candidates if self.candidates else None
+            ),
+            "tokens_per_accepted": tokens / self.accepted if self.accepted else None,
+        }
+
+
+class MetricsRegistry:
+    """Thread-safe per-stage metrics of a run.
+
+    LLM requests record tokens, latency and retries under the stage they were
+    made for, dedup passes record how many candidates they accepted. The
+    registry is dumped as JSON at the end of a run and can be exported as a
+    Prometheus textfile while the run is going. The export runs on its own
+    thread, so recording never waits for the file to be written.
+    """
+
+    def __init__(
+        self, prometheus_path: Optional[str] = None, export_interval: float = 15.0
+    ):
+        """
+        Args:
+            prometheus_path: Textfile the metrics are periodically written to
+            export_interval: Seconds between two textfile exports
+        """
+        self.prometheus_path = prometheus_path
+        self.export_interval = export_interval
+        self.stages: Dict[str, StageMetrics] = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._exporter = None
+        if prometheus_path:
+            self._exporter = threading.Thread(target=self._export_loop, daemon=True)
+            self._exporter.start()
+
+    def _stage(self, stage: str) -> StageMetrics:
+        if stage not in self.stages:
+            self.stages[stage] = StageMetrics()
+        return self.stages[stage]
+
+    def record_request(
+        self,
+        stage: str,
+        latency: float,
+        usage=None,
+        retries: int = 0,
+        failed: bool = False,
+    ):
+        """Record one LLM request.
+
+        Args:
+            stage: Pipeline stage the request was made for
+            latency: Seconds from the first attempt to the final response
+            usage: `usage` of the response, an object or a dict
+            retries: Attempts made before the final one
+            failed: Whether the request failed after all retries
+        """
+        with self._lock:
+            m = self._stage(stage)
+            m.requests += 1
+            m.retries += retries
+            m.latencies.append(latency)
+            if failed:
+                m.failures += 1
+            self._add_usage(m, usage)
+
+    def record_usage(self, stage: str, usage):
+        """Record the token usage of a request completed outside the scheduler."""
+        with self._lock:
+            m = self._stage(stage)
+            m.requests += 1
+            self._add_usage(m, usage)
+
+    def _add_usage(self, m: StageMetrics, usage):
+        if usage is None:
+            return
+        if not isinstance(usage, dict):
+            usage = usage.model_dump()
+        m.prompt_tokens += usage.get("prompt_tokens") or 0
+        m.completion_tokens += usage.get("completion_tokens") or 0
+        details = usage.get("prompt_tokens_details") or {}
+        m.cached_tokens += details.get("cached_tokens") or 0
+
+    def record_latency(self, stage: str, seconds: float):
+        """Record the duration of local work such as a dedup pass."""
+        with self._lock:
+            self._stage(stage).latencies.append(seconds)
+
+    def record_cache_hit(self, stage: str):
+        with self._lock:
+            self._stage(stage).cache_hits += 1
+
+    def record_accepted(self, stage: str, candidates: int, accepted: int):
+        """Record how many candidates produced by `stage` were accepted."""
+        with self._lock:
+            m = self._stage(stage)
+            m.candidates += candidates
+            m.accepted += accepted
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "elapsed_seconds": round(time.time() - self.started, 3),
+                "stages": {name: m.summary() for name, m in self.stages.items()},
+            }
+
+    def dump_json(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def _export_loop(self):
+        while not self._stop.wait(self.export_interval):
+            try:
+                self.write_prometheus(self.prometheus_path)
+            except OSError as e:
+                print(f"failed to export metrics: {e}")
+
+    def close(self):
+        """Stop the periodic textfile export."""
+        self._stop.set()
+        if self._exporter is not None:
+            self._exporter.join()
+
+    def write_prometheus(self, path: str):
+        """Write the metrics in the Prometheus textfile format, replacing `path` atomically."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, stage in snapshot["stages"].items():
+            for key in (
+                "requests",
+                "failures",
+                "retries",
+                "cache_hits",
+                "prompt_tokens",
+                "completion_tokens",
+                "cached_tokens",
+                "candidates",
+                "accepted",
+            ):
+                lines.append(f'pyper_{key}_total{{stage="{name}"}} {stage[key]}')
+            for q, value in stage["latency_seconds"].items():
+                lines.append(
+                    f'pyper_latency_seconds{{stage="{name}",quantile="{q}"}} {value}'
+                )
+            if stage["tokens_per_accepted"] is not None:
+                lines.append(
+                    f'pyper_tokens_per_accepted{{stage="{name}"}} '
+                    f'{stage["tokens_per_accepted"]:.3f}'
+                )
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+    def report(self):
+        """Print tokens, cached prompt tokens and acceptance of every stage.
+
+        Cached prompt tokens are the `cached_tokens` the provider reports in
+        the usage of its responses, they are only shown when it reported any.
+        """
+        for name, stage in self.snapshot()["stages"].items():
+            line = (
+                f"{name}: {stage['requests']} requests, "
+                f"{stage['prompt_tokens'] + stage['completion_tokens']} tokens"
+            )
+            if stage["cached_tokens"]:
+                line += (
+                    f" ({stage['cached_tokens']} prompt tokens reported cached, "
+                    f"{stage['cached_prompt_ratio']:.0%})"
+                )
+            if stage["candidates"]:
+                line += f", {stage['accepted']}/{stage['candidates']} accepted"
+            if stage["tokens_per_accepted"]:
+                line += (
+                    f", {stage['tokens_per_accepted']:.1f} tokens per accepted sample"
+                )
+            print(line)
+
+
+def configure_metrics(
+    prometheus_path: Optional[str] = None, export_interval: float = 15.0
+):
+    """Replace the process-wide registry, e.g. to enable the Prometheus export."""
+    global _registry
+    with _registry_lock:
+        if _registry is not None:
+            _registry.close()
+        _registry = MetricsRegistry(prometheus_path, export_interval)
+    return _registry
+
+
+def get_metrics() -> MetricsRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+        return _registry
@@ -0,0 +1,196 @@
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Mersenne prime used for the universal hash family, keeps a * x + b in uint64
+_PRIME = np.uint64((1 << 31) - 1)
+
+
+def _choose_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """Pick bands x rows whose LSH S-curve threshold is closest to `threshold`."""
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class MinHashLSH:
+    """MinHash signatures with LSH banding to find near-verbatim duplicates.
+
+    Texts are split into character shingles, signed with `num_perm` hash
+    permutations and bucketed per band. Candidates sharing a bucket are
+    verified by their estimated Jaccard similarity, so a lookup costs a few
+    dictionary probes instead of an embedding.
+
+    A large fixed set of signatures, like those of a seed file, can be added
+    with `add_base`. Its bands are kept as sorted hash arrays searched with
+    `np.searchsorted` instead of per-bucket lists, and it is not part of
+    `dump`.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 128,
+        shingle_size: int = 5,
+        seed: int = 1,
+    ):
+        """
+        Args:
+            threshold: Estimated Jaccard similarity at which texts are duplicates
+            num_perm: Number of hash permutations per signature
+            shingle_size: Length of the character shingles
+            seed: Seed of the hash permutations
+        """
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = _choose_bands(threshold, num_perm)
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(_PRIME), size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_PRIME), size=num_perm, dtype=np.uint64)
+
+        self.signatures: List[np.ndarray] = []
+        self.buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        # odd multipliers hashing the rows of a band into one uint64
+        self._band_weights = (
+            rng.integers(0, 1 << 63, size=self.rows, dtype=np.uint64) * 2 + 1
+        )
+        self.base: Optional[np.ndarray] = None
+        self._base_bands: List[Tuple[np.ndarray, np.ndarray]] = []
+
+    def _shingles(self, text: str) -> List[bytes]:
+        text = " ".join(text.lower().split())
+        k = self.shingle_size
+        if len(text) <= k:
+            return [text.encode()]
+        return list({text[i : i + k].encode() for i in range(len(text) - k + 1)})
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.array(
+            [zlib.crc32(s) for s in self._shingles(text)], dtype=np.uint64
+        )
+        hashes %= _PRIME
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def signatures_of(self, texts: List[str]) -> np.ndarray:
+        """Signatures of `texts` stacked into a `(len(texts), num_perm)` matrix."""
+        signatures = np.zeros((len(texts), self.num_perm), dtype=np.uint32)
+        for i, text in enumerate(texts):
+            signatures[i] = self.signature(text)
+        return signatures
+
+    def _band_hashes(self, signatures: np.ndarray) -> np.ndarray:
+        """uint64 hash of every band of each signature, `(n, bands)`."""
+        bands = signatures[:, : self.bands * self.rows].astype(np.uint64)
+        bands = bands.reshape(len(signatures), self.bands, self.rows)
+        # wraps around modulo 2**64
+        return (bands * self._band_weights).sum(axis=2, dtype=np.uint64)
+
+    def add_base(self, signatures: np.ndarray, chunk_size: int = 65536):
+        """Index a fixed signature matrix, for example one memory-mapped from disk.
+
+        Args:
+            signatures: Signatures of shape `(n, num_perm)`, kept by reference
+            chunk_size: Rows hashed at once
+        """
+        hashes = np.zeros((len(signatures), self.bands), dtype=np.uint64)
+        for start in range(0, len(signatures), chunk_size):
+            chunk = np.asarray(signatures[start : start + chunk_size])
+            hashes[start : start + len(chunk)] = self._band_hashes(chunk)
+
+        self.base = signatures
+        self._base_bands = []
+        for band in range(self.bands):
+            order = np.argsort(hashes[:, band], kind="stable").astype(np.int64)
+            self._base_bands.append((hashes[order, band], order))
+
+    def _is_base_duplicate(self, sig: np.ndarray) -> bool:
+        seen = set()
+        hashes = self._band_hashes(sig[None])[0]
+        for (keys, rows), key in zip(self._base_bands, hashes):
+            start = np.searchsorted(keys, key, side="left")
+            end = np.searchsorted(keys, key, side="right")
+            for idx in rows[start:end]:
+                if idx in seen:
+                    continue
+                seen.add(idx)
+                if self.similar(sig, self.base[idx]):
+                    return True
+        return False
+
+    def _band_keys(self, sig: np.ndarray) -> List[bytes]:
+        return [
+            sig[i * self.rows : (i + 1) * self.rows].tobytes()
+            for i in range(self.bands)
+        ]
+
+    def similar(self, sig_a: np.ndarray, sig_b: np.ndarray) -> bool:
+        return float(np.mean(sig_a == sig_b)) >= self.threshold
+
+    def is_duplicate(self, sig: np.ndarray) -> bool:
+        """Check whether an inserted signature is a near-duplicate of `sig`."""
+        if self.base is not None and self._is_base_duplicate(sig):
+            return True
+        seen = set()
+        for bucket, key in zip(self.buckets, self._band_keys(sig)):
+            for idx in bucket.get(key, ()):
+                if idx in seen:
+                    continue
+                seen.add(idx)
+                if self.similar(sig, self.signatures[idx]):
+                    return True
+        return False
+
+    def insert(self, sig: np.ndarray):
+        idx = len(self.signatures)
+        self.signatures.append(sig)
+        for bucket, key in zip(self.buckets, self._band_keys(sig)):
+            bucket.setdefault(key, []).append(idx)
+
+    def dump(self) -> Dict[str, Any]:
+        signatures = (
+            np.stack(self.signatures)
+            if self.signatures
+            else np.zeros((0, self.num_perm), dtype=np.uint32)
+        )
+        return {"signatures": signatures}
+
+    def load(self, dump: Dict[str, Any]):
+        for sig in dump["signatures"]:
+            self.insert(sig)
+
+    def __len__(self) -> int:
+        base = len(self.base) if self.base is not None else 0
+        return base + len(self.signatures)
+
+
+def filter_lexical_duplicates(
+    texts: List[str], lsh: MinHashLSH
+) -> Tuple[List[int], List[np.ndarray]]:
+    """Drop texts that are near-verbatim copies of indexed texts or of each other.
+
+    The index is not modified, survivors should be inserted once they are
+    accepted by every dedup stage.
+
+    Returns:
+        Indices of the surviving texts and their signatures
+    """
+    keep, signatures = [], []
+    for i, text in enumerate(texts):
+        sig = lsh.signature(text)
+        if lsh.is_duplicate(sig):
+            continue
+        if any(lsh.similar(sig, other) for other in signatures):
+            continue
+        keep.append(i)
+        signatures.append(sig)
+    return keep, signatures
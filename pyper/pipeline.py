@@ -1,10 +1,18 @@
-import json
-from dataclasses import asdict, dataclass
-from typing import Any, Dict, List, Union
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, replace
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
 
-from fission.generate import FissionGenerator
-from gen.src.general_generator import GeneralGenerator
-from gen.src.knowledge_generator import KnowledgeGenerator
+from pyper.checkpoint import Checkpoint
+from pyper.corpus import KnowledgeManifest, resolve_knowledge_files
+from pyper.sink import JsonlSink
+
+# the generators pull in numpy, pydantic and openai, the configs are imported
+# without them so the CLI starts fast
+if TYPE_CHECKING:
+    from fission.generate import FissionGenerator
+    from gen.src.general_generator import GeneralGenerator
+    from gen.src.knowledge_generator import KnowledgeGenerator
 
 
 @dataclass
@@ -15,6 +23,15 @@ class GeneralConfig:
     max_subjects: int = 5
     max_subtopics: int = 3
     max_sessions: int = 5
+    syllabi_per_iteration: int = 1
+    execution: str = "online"
+    dedup_backend: str = "numpy"
+    dedup_dtype: str = "float32"
+    embedding_cache: Optional[str] = None
+    minhash_threshold: Optional[float] = 0.8
+    minhash_num_perm: int = 128
+    answer_workers: int = 64
+    answer_queue_size: int = 256
 
 
 @dataclass
@@ -23,6 +40,19 @@ class KnowledgeConfig:
     knowledge_path: str
     num_sessions: int
     num_questions: int
+    execution: str = "online"
+    dedup_backend: str = "numpy"
+    dedup_dtype: str = "float32"
+    embedding_cache: Optional[str] = None
+    minhash_threshold: Optional[float] = 0.8
+    minhash_num_perm: int = 128
+    answer_workers: int = 64
+    answer_queue_size: int = 256
+    chunk_tokens: int = 8000
+    syllabus_concurrency: int = 8
+    knowledge_manifest: Optional[str] = None
+    retrieval_top_k: int = 3
+    passage_tokens: int = 256
 
 
 @dataclass
@@ -32,6 +62,13 @@ class FissionConfig:
     batch: int = 20
     num_seed: int = 6
     num_generated: int = 2
+    execution: str = "online"
+    dedup_backend: str = "numpy"
+    dedup_dtype: str = "float32"
+    seed_embedding_cache: bool = True
+    concurrency: int = 1
+    minhash_threshold: Optional[float] = 0.8
+    minhash_num_perm: int = 128
 
 
 class Pipeline:
@@ -49,8 +86,8 @@ class Pipeline:
 
     def __init__(
         self,
-        gen: Union[GeneralGenerator, KnowledgeGenerator] = None,
-        fission: FissionGenerator = None,
+        gen: Union["GeneralGenerator", "KnowledgeGenerator"] = None,
+        fission: "FissionGenerator" = None,
     ):
         """Initialize the pipeline with generator components.
 
@@ -62,11 +99,26 @@ class Pipeline:
         self.gen = gen
         self.fission = fission
 
-    def _save_results(self, data: List, output_path: str):
-        """Common method to save results"""
-        with open(output_path, "w") as f:
-            for l in data:
-                f.write(json.dumps(l) + "\n")
+    def _open_checkpoint(
+        self, output_path: str, resume: bool, interval: float
+    ) -> Checkpoint:
+        checkpoint = Checkpoint(f"{output_path}.ckpt", interval=interval)
+        if resume:
+            checkpoint.load()
+        return checkpoint
+
+    def _open_sink(
+        self, output_path: str, checkpoint: Checkpoint, append: bool = False
+    ) -> JsonlSink:
+        """Open the output sink, continuing the partial file of a resumed run."""
+        offset = checkpoint.state["sink_offset"] if checkpoint.state else None
+        return JsonlSink(output_path, resume_offset=offset, append=append)
+
+    def _knowledge_covered(self, gen_config: KnowledgeConfig) -> bool:
+        """Whether the manifest already holds every knowledge file unchanged."""
+        return KnowledgeManifest(gen_config.knowledge_manifest).covers(
+            resolve_knowledge_files(gen_config.knowledge_path)
+        )
 
     def run(
         self,
@@ -74,47 +126,161 @@ class Pipeline:
         result_output_path: str = None,
         gen_config: Union[GeneralConfig, KnowledgeConfig] = None,
         fission_config: FissionConfig = None,
+        resume: bool = False,
+        checkpoint_interval: float = 60.0,
     ) -> None:
         """Run the complete pipeline to generate and process tasks.
 
+        Records are streamed to the output files while each stage runs. When
+        both stages are configured and the fission config has no seed path,
+        fission reads the seed file written by the generation stage.
+
         Args:
+            seed_output_path: Path the seed data is written to
+            result_output_path: Path the fission results are written to
             gen_config: Configuration for the generator (either GeneralConfig or KnowledgeConfig)
             fission_config: Configuration for the FissionGenerator
+            resume: Continue each stage from its checkpoint next to the output file
+            checkpoint_interval: Minimum seconds between two checkpoints
 
         Raises:
             ValueError: If the generator type doesn't match the config type
         """
         # Generate seed data based on generator type
         if self.gen:
+            from gen.src.general_generator import GeneralGenerator
+            from gen.src.knowledge_generator import KnowledgeGenerator
+
             print("Starting seed generation...")
-            generator = self.gen()
-            if isinstance(self.gen, (type(GeneralGenerator))):
+            if issubclass(self.gen, GeneralGenerator):
                 if not isinstance(gen_config, GeneralConfig):
                     raise ValueError("GeneralGenerator requires GeneralConfig")
-
-                seed = generator.generate(**asdict(gen_config))
-            elif isinstance(self.gen, (type(KnowledgeGenerator))):
+            elif issubclass(self.gen, KnowledgeGenerator):
                 if not isinstance(gen_config, KnowledgeConfig):
                     raise ValueError("KnowledgeGenerator requires KnowledgeConfig")
-
-                seed = generator.generate(**asdict(gen_config))
             else:
                 raise ValueError(f"Unsupported generator type: {type(self.gen)}")
 
-            # write seed to the file
-            self._save_results(
-                data=seed,
-                output_path=seed_output_path,
+            generator = self.gen()
+            checkpoint = self._open_checkpoint(
+                seed_output_path, resume, checkpoint_interval
+            )
+            # an incremental knowledge run adds its records to the earlier output
+            incremental = isinstance(gen_config, KnowledgeConfig) and bool(
+                gen_config.knowledge_manifest
             )
+            if (
+                incremental
+                and not checkpoint.state
+                and self._knowledge_covered(gen_config)
+            ):
+                print(f"no new or changed knowledge, keeping {seed_output_path}")
+            else:
+                # seed records are written as soon as they are answered
+                with self._open_sink(
+                    seed_output_path, checkpoint, append=incremental
+                ) as sink:
+                    generator.generate(
+                        **asdict(gen_config), sink=sink, checkpoint=checkpoint
+                    )
+                checkpoint.clear()
             print("Finished generating seed...")
 
         if self.fission:
             # Run fission generation
             print("Starting fission...")
+            if self.gen and not fission_config.seed_path:
+                fission_config = replace(fission_config, seed_path=seed_output_path)
+
             fission = self.fission()
-            final = fission.generate(**asdict(fission_config))
-            self._save_results(
-                data=final,
-                output_path=result_output_path,
+            checkpoint = self._open_checkpoint(
+                result_output_path, resume, checkpoint_interval
             )
+            with self._open_sink(result_output_path, checkpoint) as sink:
+                fission.generate(
+                    **asdict(fission_config), sink=sink, checkpoint=checkpoint
+                )
+            checkpoint.clear()
             print("Finished generation!")
+
+    def _run_discipline(
+        self,
+        discipline: str,
+        output_path: str,
+        gen_config: GeneralConfig,
+        resume: bool,
+        checkpoint_interval: float,
+    ) -> Dict[str, Any]:
+        started = time.perf_counter()
+        result = {"discipline": discipline, "output": output_path}
+        try:
+            self.run(
+                seed_output_path=output_path,
+                gen_config=replace(gen_config, discipline=discipline),
+                resume=resume,
+                checkpoint_interval=checkpoint_interval,
+            )
+            with open(output_path) as f:
+                result["tasks"] = sum(1 for line in f if line.strip())
+            result["status"] = "completed"
+        except Exception as e:
+            print(f"generation for {discipline} failed: {e}")
+            result["status"] = "failed"
+            result["error"] = str(e)
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        return result
+
+    def run_disciplines(
+        self,
+        disciplines: List[str],
+        output_template: str,
+        gen_config: GeneralConfig,
+        workers: int = 4,
+        resume: bool = False,
+        checkpoint_interval: float = 60.0,
+    ) -> Dict[str, Any]:
+        """Generate seed data for several disciplines concurrently.
+
+        Disciplines run in threads of this process, so they share the request
+        scheduler and rate budget of `llm_api`. Every discipline writes its own
+        shard and checkpoint, a failed discipline does not stop the others.
+
+        Args:
+            disciplines: Disciplines to generate
+            output_template: Shard path containing `{discipline}`
+            gen_config: Configuration shared by all disciplines
+            workers: Number of disciplines generated at the same time
+            resume: Continue each discipline from its checkpoint
+            checkpoint_interval: Minimum seconds between two checkpoints
+
+        Returns:
+            Summary with the shard, task count and status of each discipline
+        """
+        from gen.src.general_generator import GeneralGenerator
+
+        if not issubclass(self.gen, GeneralGenerator):
+            raise ValueError("Multiple disciplines require a GeneralGenerator")
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    self._run_discipline,
+                    discipline,
+                    output_template.format(discipline=discipline),
+                    gen_config,
+                    resume,
+                    checkpoint_interval,
+                )
+                for discipline in disciplines
+            ]
+            results = [future.result() for future in as_completed(futures)]
+
+        order = {d: i for i, d in enumerate(disciplines)}
+        results.sort(key=lambda r: order[r["discipline"]])
+        return {
+            "disciplines": results,
+            "tasks": sum(r.get("tasks", 0) for r in results),
+            "failed": [r["discipline"] for r in results if r["status"] == "failed"],
+            "seconds": round(time.perf_counter() - started, 3),
+        }
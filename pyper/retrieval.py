@@ -0,0 +1,82 @@
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from pyper.chunking import iter_chunks
+from pyper.corpus import chunk_hash
+from pyper.dedup import NumpyIndex
+from pyper.embed_cache import EmbeddingCache
+
+
+def _passage_key(passage: str) -> bytes:
+    return bytes.fromhex(chunk_hash(passage))
+
+
+class PassageIndex:
+    """Local top-k passage search over a knowledge corpus.
+
+    The corpus is split into short passages that are embedded and stored in a
+    `NumpyIndex`, so answer prompts only carry the few passages relevant to
+    their question instead of the corpus. With a cache path the passage
+    embeddings are kept in their own `EmbeddingCache` keyed by `chunk_hash`,
+    so later runs only embed passages that changed. Queries are embedded
+    directly and never stored.
+    """
+
+    def __init__(
+        self,
+        embedding_fn: Callable,
+        dtype: str = "float32",
+        passage_tokens: int = 256,
+        batch_size: int = 256,
+        cache_path: Optional[str] = None,
+    ):
+        """
+        Args:
+            embedding_fn: Function embedding a list of texts
+            dtype: Storage type of the index rows
+            passage_tokens: Estimated tokens of a passage
+            batch_size: Passages embedded per call while building the index
+            cache_path: Path prefix of the persistent passage embedding cache
+        """
+        self.embedding_fn = embedding_fn
+        self.passage_embedding_fn = (
+            EmbeddingCache(cache_path, embedding_fn, key_fn=_passage_key)
+            if cache_path
+            else embedding_fn
+        )
+        self.passage_tokens = passage_tokens
+        self.batch_size = batch_size
+        self.index = NumpyIndex(dtype=dtype)
+        self.passages: List[str] = []
+
+    def _add(self, passages: List[str]):
+        embeddings = np.asarray(self.passage_embedding_fn(passages), dtype=np.float32)
+        self.index.add(embeddings)
+        self.passages.extend(passages)
+
+    def build(self, files: List[str]):
+        """Split `files` into passages and index them."""
+        batch = []
+        for path in files:
+            for passage in iter_chunks(path, self.passage_tokens):
+                batch.append(passage.strip())
+                if len(batch) >= self.batch_size:
+                    self._add(batch)
+                    batch = []
+        if batch:
+            self._add(batch)
+        if isinstance(self.passage_embedding_fn, EmbeddingCache):
+            self.passage_embedding_fn.save()
+        print(f"indexed {len(self.passages)} knowledge passages")
+
+    def search(self, queries: List[str], k: int = 3) -> List[List[str]]:
+        """Return the `k` passages nearest to each query, nearest first."""
+        if not queries or not self.passages or k <= 0:
+            return [[] for _ in queries]
+        embeddings = np.asarray(self.embedding_fn(queries), dtype=np.float32)
+        rows, _ = self.index.search(embeddings, k)
+        return [[self.passages[r] for r in row] for row in rows]
+
+    def __len__(self) -> int:
+        return len(self.passages)
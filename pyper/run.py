@@ -1,10 +1,156 @@
 import argparse
+import hashlib
+import json
+import os
 import time
+from typing import List
 
-from fission.generate import FissionGenerator
-from gen.src.general_generator import GeneralGenerator
-from gen.src.knowledge_generator import KnowledgeGenerator
 from pipeline import FissionConfig, GeneralConfig, KnowledgeConfig, Pipeline
+from pyper.llm_api import (
+    configure_cache,
+    configure_client,
+    configure_endpoints,
+    configure_scheduler,
+    get_cache,
+    get_endpoint_pool,
+    load_endpoints,
+)
+from pyper.metrics import configure_metrics
+
+
+def add_client_args(parser: argparse.ArgumentParser):
+    """Options shared by every command that talks to the LLM"""
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        help="Size of the HTTP connection pool of each endpoint. Default: 200",
+    )
+    parser.add_argument(
+        "--endpoints",
+        help="JSON file with a list of endpoints to balance requests over, each "
+        "with base_url, api_key or api_key_env, model, weight and optional rpm, "
+        "tpm and max_concurrency. Default: the OPENAI_* environment variables",
+    )
+    parser.add_argument(
+        "--request-timeout",
+        type=float,
+        help="Timeout in seconds for a single LLM request. Default: 120",
+    )
+    parser.add_argument(
+        "--rpm", type=int, help="Requests-per-minute budget. Default: unlimited"
+    )
+    parser.add_argument(
+        "--tpm", type=int, help="Tokens-per-minute budget. Default: unlimited"
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        help="Upper bound for adaptive in-flight requests. Default: 64",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        help="Retries for rate-limited or failed requests. Default: 6",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default="./data/cache",
+        help="Directory of the LLM response cache. Default: ./data/cache",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Disable the LLM response cache"
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        help="Hours before a cached response expires. Default: 168",
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        help="Size bound of the response cache in MB. Default: 1024",
+    )
+
+
+def add_resume_args(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume from the checkpoint stored next to the output file",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=float,
+        default=60.0,
+        help="Minimum seconds between checkpoints. Default: 60",
+    )
+
+
+def add_execution_arg(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--execution",
+        choices=["online", "batch"],
+        default="online",
+        help="Send requests online or through the Batch API. Default: online",
+    )
+
+
+def add_dedup_args(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--dedup-backend",
+        choices=["numpy", "chroma"],
+        help="Index used for deduplication. Default: numpy",
+    )
+    parser.add_argument(
+        "--dedup-dtype",
+        choices=["float32", "float16", "int8"],
+        help="Storage type of the numpy dedup index. Default: float32",
+    )
+    parser.add_argument(
+        "--minhash-threshold",
+        type=float,
+        help="Jaccard similarity at which the MinHash prefilter drops a candidate "
+        "before embedding, 0 disables it. Default: 0.8",
+    )
+    parser.add_argument(
+        "--minhash-num-perm",
+        type=int,
+        help="Number of MinHash permutations. Default: 128",
+    )
+
+
+def add_metrics_args(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--metrics-output",
+        help="Path of the JSON metrics written at the end of the run. "
+        "Default: next to the output file",
+    )
+    parser.add_argument(
+        "--prometheus-textfile",
+        help="Prometheus textfile the metrics are exported to during the run",
+    )
+
+
+def read_disciplines(values: List[str]) -> List[str]:
+    """Expand `--discipline` values, reading files with one discipline per line"""
+    disciplines = []
+    for value in values:
+        if os.path.isfile(value):
+            with open(value) as f:
+                disciplines.extend(
+                    line.strip()
+                    for line in f
+                    if line.strip() and not line.startswith("#")
+                )
+        else:
+            disciplines.append(value)
+    # keep the first occurrence so every discipline gets one shard
+    return list(dict.fromkeys(disciplines))
+
+
+def provided(**kwargs):
+    """Drop options not given on the command line so config defaults apply"""
+    return {k: v for k, v in kwargs.items() if v is not None}
 
 
 def main():
@@ -36,8 +182,22 @@ def main():
         type=int,
         help="Maximum sessions to generate per subject. Default: 3",
     )
-    gen_parser.add_argument("--seed-output", help="Path for seed output file")
-    gen_parser.add_argument("--discipline", help="<General>: Discipline to generate")
+    gen_parser.add_argument(
+        "--seed-output",
+        help="Path for seed output file. With several disciplines it must contain "
+        "{discipline}. Default: ./data/{discipline}_seed.jsonl",
+    )
+    gen_parser.add_argument(
+        "--discipline",
+        nargs="+",
+        help="<General>: Disciplines to generate, or files with one discipline per line",
+    )
+    gen_parser.add_argument(
+        "--discipline-workers",
+        type=int,
+        default=4,
+        help="<General>: Disciplines generated concurrently. Default: 4",
+    )
     gen_parser.add_argument(
         "--max-subjects",
         type=int,
@@ -49,8 +209,53 @@ def main():
         help="<General>: Maximum subtopics to generate. Default: 3",
     )
     gen_parser.add_argument(
-        "--knowledge-path", help="<Knowledge>: Path to knowledge file to use"
+        "--syllabi-per-iteration",
+        type=int,
+        help="<General>: Syllabi whose sessions are requested concurrently per "
+        "iteration. Default: 1",
+    )
+    gen_parser.add_argument(
+        "--knowledge-path",
+        help="<Knowledge>: Knowledge file, directory or glob pattern to use",
+    )
+    gen_parser.add_argument(
+        "--knowledge-manifest",
+        help="<Knowledge>: Manifest of the knowledge already processed, only new "
+        "or changed content is used. Default: a file per knowledge path in the "
+        "cache directory",
+    )
+    gen_parser.add_argument(
+        "--no-manifest",
+        action="store_true",
+        help="<Knowledge>: Process the whole knowledge path without a manifest",
+    )
+    gen_parser.add_argument(
+        "--chunk-tokens",
+        type=int,
+        help="<Knowledge>: Tokens of knowledge per syllabus request, larger files "
+        "are split and the partial syllabi merged. Default: 8000",
+    )
+    gen_parser.add_argument(
+        "--syllabus-concurrency",
+        type=int,
+        help="<Knowledge>: Syllabus requests in flight at once. Default: 8",
+    )
+    gen_parser.add_argument(
+        "--retrieval-top-k",
+        type=int,
+        help="<Knowledge>: Passages of the knowledge retrieved into each answer "
+        "prompt, 0 disables retrieval. Default: 3",
+    )
+    gen_parser.add_argument(
+        "--passage-tokens",
+        type=int,
+        help="<Knowledge>: Tokens of a retrieved passage. Default: 256",
     )
+    add_execution_arg(gen_parser)
+    add_dedup_args(gen_parser)
+    add_resume_args(gen_parser)
+    add_metrics_args(gen_parser)
+    add_client_args(gen_parser)
 
     # Fission command
     fission_parser = subparsers.add_parser("fission", help="Run fission generation")
@@ -58,7 +263,9 @@ def main():
         "--num-tasks", type=int, required=True, help="Number of total tasks to generate"
     )
     fission_parser.add_argument(
-        "--seed-path", required=True, help="Path to seed data for fission"
+        "--seed-path",
+        required=True,
+        help="JSONL seed data for fission, optionally gzip or zstd compressed",
     )
     fission_parser.add_argument(
         "--batch",
@@ -75,54 +282,193 @@ def main():
         type=int,
         help="Number of tasks to sample from generated pool. Default: 2",
     )
+    fission_parser.add_argument(
+        "--concurrency",
+        type=int,
+        help="Sampling rounds kept in flight in online mode. Default: 1",
+    )
+    fission_parser.add_argument(
+        "--result-output",
+        help="Path for result output file. Required with --resume",
+    )
+    add_execution_arg(fission_parser)
+    add_dedup_args(fission_parser)
+    add_resume_args(fission_parser)
+    add_metrics_args(fission_parser)
+    add_client_args(fission_parser)
 
     args = parser.parse_args()
 
     if args.command is None:
         parser.print_help()
         exit(1)
-    elif args.command == "generate":
+
+    configure_client(
+        max_connections=args.max_connections,
+        timeout=args.request_timeout,
+    )
+    configure_scheduler(
+        rpm=args.rpm,
+        tpm=args.tpm,
+        max_concurrency=args.max_concurrency,
+        max_retries=args.max_retries,
+    )
+    if args.endpoints:
+        configure_endpoints(load_endpoints(args.endpoints))
+    configure_cache(
+        cache_dir=None if args.no_cache else args.cache_dir,
+        max_bytes=args.cache_max_mb * 1024 * 1024 if args.cache_max_mb else None,
+        ttl=args.cache_ttl * 3600 if args.cache_ttl else None,
+    )
+    metrics = configure_metrics(prometheus_path=args.prometheus_textfile)
+
+    if args.command == "fission" and args.resume and not args.result_output:
+        fission_parser.error("--resume requires --result-output")
+
+    if args.command == "generate":
+        disciplines = read_disciplines(args.discipline) if args.discipline else []
+        output_template = args.seed_output or "./data/{discipline}_seed.jsonl"
+        if len(disciplines) > 1 and "{discipline}" not in output_template:
+            gen_parser.error("--seed-output must contain {discipline}")
+        question_cache = (
+            None
+            if args.no_cache
+            else os.path.join(args.cache_dir, "question_embeddings")
+        )
         if args.mode == "general":
             gen_config = GeneralConfig(
-                discipline=args.discipline,
-                num_tasks=args.num_tasks,
-                max_subjects=args.max_subjects,
-                max_subtopics=args.max_subtopics,
-                max_sessions=args.max_sessions,
-                num_questions=args.num_questions,
+                **provided(
+                    discipline=disciplines[0] if disciplines else None,
+                    num_tasks=args.num_tasks,
+                    max_subjects=args.max_subjects,
+                    max_subtopics=args.max_subtopics,
+                    max_sessions=args.max_sessions,
+                    syllabi_per_iteration=args.syllabi_per_iteration,
+                    num_questions=args.num_questions,
+                    execution=args.execution,
+                    dedup_backend=args.dedup_backend,
+                    dedup_dtype=args.dedup_dtype,
+                    minhash_threshold=args.minhash_threshold,
+                    minhash_num_perm=args.minhash_num_perm,
+                    embedding_cache=question_cache,
+                )
             )
+            from gen.src.general_generator import GeneralGenerator
+
             generator = GeneralGenerator
         else:
+            knowledge_manifest = None
+            if not args.no_manifest:
+                knowledge_manifest = args.knowledge_manifest or os.path.join(
+                    args.cache_dir,
+                    "knowledge",
+                    hashlib.sha1(
+                        os.path.abspath(args.knowledge_path).encode()
+                    ).hexdigest()[:16]
+                    + ".json",
+                )
             gen_config = KnowledgeConfig(
-                num_tasks=args.num_tasks,
-                knowledge_path=args.knowledge_path,
-                num_sessions=args.max_sessions,
-                num_questions=args.num_questions,
+                **provided(
+                    num_tasks=args.num_tasks,
+                    knowledge_path=args.knowledge_path,
+                    knowledge_manifest=knowledge_manifest,
+                    chunk_tokens=args.chunk_tokens,
+                    syllabus_concurrency=args.syllabus_concurrency,
+                    retrieval_top_k=args.retrieval_top_k,
+                    passage_tokens=args.passage_tokens,
+                    num_sessions=args.max_sessions or 3,
+                    num_questions=args.num_questions,
+                    execution=args.execution,
+                    dedup_backend=args.dedup_backend,
+                    dedup_dtype=args.dedup_dtype,
+                    minhash_threshold=args.minhash_threshold,
+                    minhash_num_perm=args.minhash_num_perm,
+                    embedding_cache=question_cache,
+                )
             )
+            from gen.src.knowledge_generator import KnowledgeGenerator
+
             generator = KnowledgeGenerator
 
         pipeline = Pipeline(gen=generator)
-        pipeline.run(
-            seed_output_path=args.seed_output or f"./data/{args.discipline}_seed.jsonl",
-            gen_config=gen_config,
-        )
+        if args.mode == "general" and len(disciplines) > 1:
+            summary = pipeline.run_disciplines(
+                disciplines,
+                output_template,
+                gen_config,
+                workers=args.discipline_workers,
+                resume=args.resume,
+                checkpoint_interval=args.checkpoint_interval,
+            )
+            output_path = os.path.join(
+                os.path.dirname(output_template.format(discipline="")), "disciplines"
+            )
+            with open(f"{output_path}.summary.json", "w") as f:
+                json.dump(summary, f, indent=2)
+            for result in summary["disciplines"]:
+                print(
+                    f"{result['discipline']}: {result['status']}, "
+                    f"{result.get('tasks', 0)} tasks in {result['seconds']}s"
+                )
+            print(
+                f"{summary['tasks']} tasks over {len(disciplines)} disciplines, "
+                f"summary written to {output_path}.summary.json"
+            )
+        else:
+            output_path = output_template.format(
+                discipline=disciplines[0] if disciplines else None
+            )
+            pipeline.run(
+                seed_output_path=output_path,
+                gen_config=gen_config,
+                resume=args.resume,
+                checkpoint_interval=args.checkpoint_interval,
+            )
 
     elif args.command == "fission":
         fission_config = FissionConfig(
-            num_tasks=args.num_tasks,
-            seed_path=args.seed_path,
-            batch=args.batch,
-            num_seed=args.num_seed,
-            num_generated=args.num_generated,
+            **provided(
+                num_tasks=args.num_tasks,
+                seed_path=args.seed_path,
+                batch=args.batch,
+                num_seed=args.num_seed,
+                num_generated=args.num_generated,
+                concurrency=args.concurrency,
+                execution=args.execution,
+                dedup_backend=args.dedup_backend,
+                dedup_dtype=args.dedup_dtype,
+                minhash_threshold=args.minhash_threshold,
+                minhash_num_perm=args.minhash_num_perm,
+                seed_embedding_cache=not args.no_cache,
+            )
         )
+        from fission.generate import FissionGenerator
+
         generator = FissionGenerator
 
+        output_path = args.result_output or f"./data/results_{time.time()}.jsonl"
         pipeline = Pipeline(fission=generator)
         pipeline.run(
-            result_output_path=f"./data/results_{time.time()}.jsonl",
+            result_output_path=output_path,
             fission_config=fission_config,
+            resume=args.resume,
+            checkpoint_interval=args.checkpoint_interval,
         )
 
+    cache = get_cache()
+    if cache is not None:
+        stats = cache.stats()
+        print(f"response cache: {stats['hits']} hits, {stats['misses']} misses")
+        cache.close()
+
+    metrics.report()
+    if args.endpoints:
+        get_endpoint_pool().report()
+    metrics.dump_json(args.metrics_output or f"{output_path}.metrics.json")
+    metrics.close()
+    if args.prometheus_textfile:
+        metrics.write_prometheus(args.prometheus_textfile)
+
 
 if __name__ == "__main__":
     main()
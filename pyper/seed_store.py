@@ -0,0 +1,162 @@
+import json
+import mmap
+import os
+import shutil
+import tempfile
+from collections.abc import Sequence
+from typing import Dict, List, Union
+
+import numpy as np
+
+from pyper.embed_cache import save_npy
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# bytes of the seed file scanned for line breaks at once while indexing
+SCAN_BYTES = 1 << 24
+
+
+def _compression(path: str) -> str:
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    if magic.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return ""
+
+
+def _is_fresh(path: str, source: str) -> bool:
+    """Whether `path`, derived from `source`, exists and is not older than it."""
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source)
+
+
+def _decompress(path: str, compression: str) -> str:
+    """Decompress `path` once into a sidecar file and return the sidecar path.
+
+    The sidecar is rebuilt when the compressed file is newer than it. It is
+    written to a uniquely named temp file first, so jobs reading the same seed
+    file never write into each other's output.
+    """
+    raw_path = f"{path}.raw.jsonl"
+    if _is_fresh(raw_path, path):
+        return raw_path
+
+    print(f"decompressing {path}...")
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(raw_path)), suffix=".tmp"
+    )
+    try:
+        with open(path, "rb") as src, os.fdopen(fd, "wb") as dst:
+            if compression == "gzip":
+                import gzip
+
+                with gzip.GzipFile(fileobj=src) as reader:
+                    shutil.copyfileobj(reader, dst, SCAN_BYTES)
+            else:
+                try:
+                    import zstandard
+                except ImportError as e:
+                    raise ImportError(
+                        "zstd compressed seed files need the zstandard package"
+                    ) from e
+
+                with zstandard.ZstdDecompressor().stream_reader(src) as reader:
+                    shutil.copyfileobj(reader, dst, SCAN_BYTES)
+        os.replace(tmp_path, raw_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return raw_path
+
+
+class SeedStore(Sequence):
+    """Random-access view of a JSONL seed file that decodes lines on demand.
+
+    The file is memory-mapped and indexed by the byte offset of every
+    non-blank line, stored as a uint64 array in `<file>.idx.npy` so later runs
+    skip the scan. Only the lines that are accessed are parsed, so sampling a
+    few seeds per round costs the same for a file of any size. gzip and zstd
+    files are decompressed once into a `<file>.raw.jsonl` sidecar that is
+    indexed the same way. The sidecar trades disk space, the size of the
+    uncompressed file, for plain random access, since neither format can
+    seek into a stream without decoding it from the start.
+
+    Supports `len`, indexing, slicing and iteration like a list of dicts, so
+    `random.sample` draws the same seeds as it would from the parsed list.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: JSONL seed file, optionally gzip or zstd compressed
+        """
+        self.path = path
+        compression = _compression(path)
+        self.data_path = _decompress(path, compression) if compression else path
+        self.index_path = f"{self.data_path}.idx.npy"
+
+        self._file = open(self.data_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # an empty file can't be mapped
+        self._data = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        )
+        self.offsets = self._load_offsets(size)
+
+    def _load_offsets(self, size: int) -> np.ndarray:
+        if _is_fresh(self.index_path, self.data_path):
+            offsets = np.load(self.index_path)
+            if len(offsets) and offsets[-1] == size:
+                return offsets
+
+        offsets = self._scan(size)
+        save_npy(self.index_path, offsets)
+        return offsets
+
+    def _scan(self, size: int) -> np.ndarray:
+        """Start offsets of the non-blank lines followed by the file size.
+
+        A line runs up to the start of the next one, blank lines in between are
+        whitespace that `json.loads` ignores.
+        """
+        breaks = [np.array([-1], dtype=np.int64)]
+        for start in range(0, size, SCAN_BYTES):
+            block = np.frombuffer(self._data[start : start + SCAN_BYTES], np.uint8)
+            breaks.append(np.flatnonzero(block == ord("\n")) + start)
+        ends = np.concatenate(breaks + [np.array([size], dtype=np.int64)])
+        starts = ends[:-1] + 1
+        ends = ends[1:]
+
+        # short lines may hold only whitespace, they are checked one by one
+        keep = ends - starts > 16
+        for i in np.flatnonzero(~keep):
+            keep[i] = bool(self._data[starts[i] : ends[i]].strip())
+        return np.append(starts[keep], size).astype(np.uint64)
+
+    def _decode(self, i: int) -> Dict:
+        return json.loads(self._data[self.offsets[i] : self.offsets[i + 1]])
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[Dict, List[Dict]]:
+        if isinstance(i, slice):
+            return [self._decode(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("seed index out of range")
+        return self._decode(i)
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
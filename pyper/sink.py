@@ -0,0 +1,113 @@
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+
+class JsonlSink:
+    """Streams records to a JSONL file as soon as they are produced.
+
+    Records are appended to `<path>.partial` through a buffered writer that is
+    flushed and fsynced every `flush_every` records or `flush_interval` seconds,
+    so partial results survive a crash. `close` renames the partial file to
+    `path` atomically once the run completed. Used as a context manager the
+    rename only happens when the block exits without an error.
+
+    In append mode the partial file starts as a copy of the existing output,
+    so the records of earlier runs are kept.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_every: int = 100,
+        flush_interval: float = 5.0,
+        buffer_size: int = 1024 * 1024,
+        resume_offset: Optional[int] = None,
+        append: bool = False,
+    ):
+        """
+        Args:
+            path: Final output path
+            flush_every: Number of records between flushes
+            flush_interval: Maximum seconds between flushes
+            buffer_size: Size of the write buffer in bytes
+            resume_offset: Continue an existing partial file, truncated to this
+                byte offset. Starts a new file when not set
+            append: Add the records of a new file to the existing output
+                instead of replacing it
+        """
+        self.path = path
+        self.partial_path = f"{path}.partial"
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.count = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if resume_offset is not None and os.path.exists(self.partial_path):
+            self._file = open(self.partial_path, "r+b", buffering=buffer_size)
+            self._file.truncate(resume_offset)
+            self._file.seek(resume_offset)
+        else:
+            if append and os.path.exists(path):
+                shutil.copyfile(path, self.partial_path)
+            mode = "ab" if append else "wb"
+            self._file = open(self.partial_path, mode, buffering=buffer_size)
+
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict):
+        with self._lock:
+            self._file.write((json.dumps(record) + "\n").encode())
+            self.count += 1
+            self._pending += 1
+            if (
+                self._pending >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            ):
+                self._flush()
+
+    def write_many(self, records: Iterable[Dict]):
+        for record in records:
+            self.write(record)
+
+    def _flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def tell(self) -> int:
+        """Flush and return the number of bytes safely on disk."""
+        with self._lock:
+            self._flush()
+            return self._file.tell()
+
+    def close(self, complete: bool = True):
+        """Flush the remaining records and publish the file.
+
+        Args:
+            complete: Rename the partial file to the final path. When False the
+                partial file is kept so the run can be inspected or resumed
+        """
+        with self._lock:
+            if self._file.closed:
+                return
+            self._flush()
+            self._file.close()
+            if complete:
+                os.replace(self.partial_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(complete=exc_type is None)
@@ -0,0 +1,91 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List
+
+from pyper.llm_api import run_async
+
+
+class WorkQueue:
+    """Bounded queue drained concurrently by workers on the shared event loop.
+
+    Producers call `put` from a regular thread. At most `max_pending` items are
+    queued or being processed at once, so `put` blocks while the workers are
+    behind. Items whose handler raises are put back at the end of the queue
+    until they failed `max_attempts` times.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable],
+        num_workers: int = 64,
+        max_pending: int = 256,
+        max_attempts: int = 3,
+    ):
+        """
+        Args:
+            handler: Coroutine function processing a single item
+            num_workers: Number of items processed concurrently
+            max_pending: Items accepted before `put` blocks
+            max_attempts: Attempts per item before it is given up
+        """
+        self.handler = handler
+        self.num_workers = num_workers
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.failed: List[Any] = []
+
+        self._queue = None
+        self._slots = None
+        self._workers = []
+
+    async def _start(self):
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.num_workers)
+        ]
+
+    def start(self):
+        run_async(self._start())
+
+    async def _put(self, item: Any):
+        await self._slots.acquire()
+        self._queue.put_nowait((item, 1))
+
+    def put(self, item: Any):
+        """Queue an item, blocking while `max_pending` items are unfinished."""
+        run_async(self._put(item))
+
+    async def _worker(self):
+        while True:
+            item, attempt = await self._queue.get()
+            try:
+                await self.handler(item)
+                self._slots.release()
+            except Exception as e:
+                if attempt < self.max_attempts:
+                    print(f"retrying item after attempt {attempt}: {e}")
+                    self._queue.put_nowait((item, attempt + 1))
+                else:
+                    print(f"giving up on item after {attempt} attempts: {e}")
+                    self.failed.append(item)
+                    self._slots.release()
+            finally:
+                self._queue.task_done()
+
+    async def _join(self):
+        await self._queue.join()
+        await self._cancel()
+
+    def join(self):
+        """Block until every queued item is processed and stop the workers."""
+        run_async(self._join())
+
+    async def _cancel(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def cancel(self):
+        """Stop the workers without waiting for queued items, they are dropped."""
+        run_async(self._cancel())